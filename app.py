@@ -1,15 +1,17 @@
 import streamlit as st
-import requests
+import fetch
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from openai import OpenAI
 from urllib.parse import urlparse
 import os
+from metering import TokenMeter
 
 from dotenv import load_dotenv
 load_dotenv()
 
 openai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+meter = TokenMeter()
 
 def get_domain(url):
     parsed = urlparse(url)
@@ -25,7 +27,7 @@ def crawl_links(base_url, limit=5):
         visited.add(url)
 
         try:
-            r = requests.get(url, timeout=10)
+            r = fetch.get(url)
             soup = BeautifulSoup(r.text, "html.parser")
             [s.decompose() for s in soup(["script", "style", "noscript"])]
             texts.append(soup.get_text(separator=" ", strip=True))
@@ -51,6 +53,10 @@ Respond only in compact JSON."""
         messages=[{"role": "user", "content": prompt}],
         temperature=0.2
     )
+    if res.usage:
+        meter.record(url, "extract", "gpt-4o", res.usage.prompt_tokens, res.usage.completion_tokens)
+    else:
+        meter.record_text(url, "extract", "gpt-4o", prompt, res.choices[0].message.content)
     return res.choices[0].message.content
 
 st.title("🔎 Company Enrichment from Website")
@@ -65,3 +71,5 @@ if st.button("Enrich") and url:
         else:
             info = get_company_info(text, url)
             st.code(info, language="json")
+            usage = meter.totals('company')[url]
+            st.caption(f"Tokens: {usage['prompt_tokens']} prompt + {usage['completion_tokens']} completion (${usage['cost']:.4f})")
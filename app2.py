@@ -1,309 +1,67 @@
 import streamlit as st
-import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin, urlparse
+import logging
 import os
-import json
-import re
-from typing import Dict, List, Optional
-from dataclasses import dataclass
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
 from dotenv import load_dotenv
 
-# LangChain imports
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-from langchain.chains.summarize import load_summarize_chain
-from langchain.chat_models import ChatOpenAI
-from langchain.prompts import PromptTemplate
+from extraction import company_info_json
+import fetch
+from metering import Budget, TokenMeter
+from diagnostics import DIAGNOSTICS_DIR, DIAGNOSTICS_ENABLED, Diagnostics
+from pipeline import EnhancedWebScraper, logger as pipeline_logger
+from triage import probe_domain
+from cascade import configured_models
 
 load_dotenv()
 
-@dataclass
-class CompanyInfo:
-    legal_name: str = ""
-    description: str = ""
-    industry: str = ""
-    employees: str = ""
-    annual_revenue: str = ""
-    linkedin: str = ""
-    facebook: str = ""
-    twitter: str = ""
-    pinterest: str = ""
-    address: Dict = None
-    sic_code: str = ""
-    phone: str = ""
-    email: str = ""
-
-class EnhancedWebScraper:
-    def __init__(self, openai_api_key: str):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",  # Using mini for cost efficiency
-            temperature=0.1,
-            openai_api_key=openai_api_key
-        )
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200,
-            length_function=len
-        )
-        
-    def get_domain(self, url: str) -> str:
-        parsed = urlparse(url)
-        return f"{parsed.scheme}://{parsed.netloc}"
+class StreamlitLogHandler(logging.Handler):
+    """Show the pipeline's warnings and errors in the page
     
-    def extract_structured_data(self, soup: BeautifulSoup, base_url: str) -> Dict:
-        """Extract structured data from HTML elements"""
-        structured_data = {
-            'social_links': {},
-            'contact_info': {},
-            'metadata': {}
-        }
-        
-        # Extract social media links
-        social_patterns = {
-            'linkedin': r'linkedin\.com',
-            'facebook': r'facebook\.com',
-            'twitter': r'twitter\.com|x\.com',
-            'pinterest': r'pinterest\.com',
-            'instagram': r'instagram\.com',
-            'youtube': r'youtube\.com'
-        }
-        
-        for link in soup.find_all('a', href=True):
-            href = link.get('href', '')
-            full_url = urljoin(base_url, href)
-            
-            for platform, pattern in social_patterns.items():
-                if re.search(pattern, full_url, re.IGNORECASE):
-                    structured_data['social_links'][platform] = full_url
-                    break
-        
-        # Extract contact information
-        text_content = soup.get_text()
-        
-        # Phone numbers
-        phone_pattern = r'(?:\+?1[-.\s]?)?\(?([0-9]{3})\)?[-.\s]?([0-9]{3})[-.\s]?([0-9]{4})'
-        phones = re.findall(phone_pattern, text_content)
-        if phones:
-            structured_data['contact_info']['phone'] = f"({phones[0][0]}) {phones[0][1]}-{phones[0][2]}"
-        
-        # Email addresses
-        email_pattern = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
-        emails = re.findall(email_pattern, text_content)
-        if emails:
-            structured_data['contact_info']['email'] = emails[0]
-        
-        # Extract meta tags
-        meta_tags = soup.find_all('meta')
-        for tag in meta_tags:
-            name = tag.get('name', '').lower()
-            content = tag.get('content', '')
-            if name in ['description', 'keywords'] and content:
-                structured_data['metadata'][name] = content
-        
-        return structured_data
+    Every Streamlit session runs its script on its own thread, and the
+    pipeline logger is shared by all of them, so only records emitted by the
+    thread that attached the handler are shown.
+    """
     
-    def get_priority_pages(self, base_url: str) -> List[str]:
-        """Get priority pages that are most likely to contain company info"""
-        priority_paths = [
-            '', '/', '/about', '/about-us', '/company', '/contact', 
-            '/team', '/leadership', '/careers', '/services', '/products'
-        ]
-        
-        pages = []
-        for path in priority_paths:
-            if path == '' or path == '/':
-                pages.append(base_url)
-            else:
-                pages.append(urljoin(base_url, path))
-        
-        return pages
-
+    def __init__(self, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.thread = threading.get_ident()
     
-    def scrape_page(self, url: str) -> Optional[Dict]:
-        """Scrape a single page and return structured data"""
-        try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=10, headers=headers)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Remove unwanted elements
-            for element in soup(['script', 'style', 'noscript', 'nav', 'footer', 'header']):
-                element.decompose()
-            
-            # Extract structured data
-            structured_data = self.extract_structured_data(soup, url)
-            
-            # Get clean text
-            text = soup.get_text(separator=' ', strip=True)
-            # Clean up whitespace
-            text = re.sub(r'\s+', ' ', text).strip()
-            
-            return {
-                'url': url,
-                'text': text,
-                'structured_data': structured_data
-            }
-            
-        except Exception as e:
-            st.warning(f"Failed to scrape {url}: {str(e)}")
-            return None
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.thread == self.thread and super().filter(record)
     
-    def crawl_company_site(self, base_url: str, max_pages: int = 10) -> List[Dict]:
-        """Crawl company website focusing on priority pages and additional discovered pages"""
-        base_domain = self.get_domain(base_url)
-        priority_pages = self.get_priority_pages(base_domain)
-        
-        scraped_data = []
-        visited = set()
-        to_visit = set(priority_pages)
-        
-        # First, scrape priority pages
-        while to_visit and len(scraped_data) < max_pages:
-            page_url = to_visit.pop()
-            if page_url not in visited:
-                page_data = self.scrape_page(page_url)
-                if page_data and page_data['text']:
-                    scraped_data.append(page_data)
-                    visited.add(page_url)
-                    
-                    # Discover additional pages
-                    soup = BeautifulSoup(page_data['text'], 'html.parser')
-                    for link in soup.find_all('a', href=True):
-                        href = link.get('href', '')
-                        full_url = urljoin(base_url, href)
-                        if urlparse(full_url).netloc == urlparse(base_url).netloc and full_url not in visited:
-                            to_visit.add(full_url)
-        
-        return scraped_data
-    
-    def create_company_summary(self, scraped_data: List[Dict]) -> str:
-        """Create a concise summary of company information using LangChain"""
-        
-        # Combine all structured data
-        all_social_links = {}
-        all_contact_info = {}
-        all_metadata = {}
-        
-        for data in scraped_data:
-            structured = data.get('structured_data', {})
-            all_social_links.update(structured.get('social_links', {}))
-            all_contact_info.update(structured.get('contact_info', {}))
-            all_metadata.update(structured.get('metadata', {}))
-        
-        # Prepare documents for summarization
-        documents = []
-        for data in scraped_data:
-            # Prioritize about and contact pages
-            priority_score = 1.0
-            if any(keyword in data['url'].lower() for keyword in ['about', 'contact', 'company']):
-                priority_score = 2.0
-            
-            doc = Document(
-                page_content=data['text'][:1500],  # Limit individual page content
-                metadata={
-                    'url': data['url'],
-                    'priority': priority_score
-                }
-            )
-            documents.append(doc)
-        
-        # Create summary prompt
-        summary_prompt = PromptTemplate(
-            template="""
-            Analyze the following company website content and extract key information:
-            
-            {text}
-            
-            Focus on identifying:
-            1. Company name and legal entity name
-            2. Business description and industry
-            3. Company size indicators (employees, revenue mentions)
-            4. Key services or products
-            5. Location/address information
-            
-            Provide a concise summary in 3-4 sentences focusing on the most important company details.
-            """,
-            input_variables=["text"]
-        )
-        
-        # Use map-reduce for large content
-        if len(documents) > 1:
-            summarize_chain = load_summarize_chain(
-                self.llm,
-                chain_type="map_reduce",
-                map_prompt=summary_prompt,
-                combine_prompt=PromptTemplate(
-                    template="Combine the following summaries into a comprehensive company profile:\n\n{text}",
-                    input_variables=["text"]
-                )
-            )
-            summary = summarize_chain.run(documents)
+    def emit(self, record: logging.LogRecord):
+        if record.levelno >= logging.ERROR:
+            st.error(record.getMessage())
         else:
-            summary = self.llm.predict(summary_prompt.format(text=documents[0].page_content))
-        
-        return {
-            'summary': summary,
-            'social_links': all_social_links,
-            'contact_info': all_contact_info,
-            'metadata': all_metadata
-        }
-    
-    def extract_company_info(self, company_data: Dict, base_url: str) -> str:
-        """Extract structured company information using the summary"""
-        
-        extraction_prompt = f"""
-        Based on the following company information, extract structured data:
-        
-        Website: {base_url}
-        Summary: {company_data['summary']}
-        Social Links: {company_data['social_links']}
-        Contact Info: {company_data['contact_info']}
-        Metadata: {company_data['metadata']}
-        
-        Extract and return ONLY a JSON object with these exact keys:
-        {{
-            "legal_name": "Company legal name",
-            "description": "Brief business description",
-            "industry": "Industry sector",
-            "employees": "Employee count or range",
-            "annual_revenue": "Revenue information if available",
-            "linkedin": "LinkedIn URL",
-            "facebook": "Facebook URL", 
-            "twitter": "Twitter/X URL",
-            "pinterest": "Pinterest URL",
-            "address": {{
-                "street": "Street address",
-                "city": "City",
-                "state": "State",
-                "zip": "ZIP code",
-                "country": "Country"
-            }},
-            "sic_code": "SIC code if determinable",
-            "phone": "Phone number",
-            "email": "Email address"
-        }}
-        
-        Use "Not found" for missing information. Return only the JSON object.
-        """
-        
-        try:
-            response = self.llm.predict(extraction_prompt)
-            # Clean the response to ensure it's valid JSON
-            response = response.strip()
-            if response.startswith('```json'):
-                response = response[7:-3]
-            elif response.startswith('```'):
-                response = response[3:-3]
-            
-            return response
-        except Exception as e:
-            st.error(f"Error extracting company info: {str(e)}")
-            return "{}"
+            st.warning(record.getMessage())
+
+@contextmanager
+def show_pipeline_logs() -> Iterator[None]:
+    """Forward this session's pipeline warnings to the page for the duration of one run"""
+    handler = StreamlitLogHandler(logging.WARNING)
+    pipeline_logger.addHandler(handler)
+    try:
+        yield
+    finally:
+        pipeline_logger.removeHandler(handler)
+
+def render_structured_data(placeholder, structured_data: Dict):
+    """Render the deterministic fields found so far into a Streamlit placeholder"""
+    with placeholder.container():
+        st.subheader("⚡ Found on the website")
+        contact_info = structured_data['contact_info']
+        if contact_info.get('email'):
+            st.write(f"**Email:** {contact_info['email']}")
+        if contact_info.get('phone'):
+            st.write(f"**Phone:** {contact_info['phone']}")
+        if contact_info.get('address'):
+            st.write("**Address:** " + ", ".join(value for value in contact_info['address'].values() if value))
+        for platform, link in structured_data['social_links'].items():
+            st.write(f"**{platform.title()}:** {link}")
+        if structured_data['metadata'].get('description'):
+            st.write(f"**Meta description:** {structured_data['metadata']['description']}")
 
 def main():
     st.title("🔎 Enhanced Company Enrichment Tool")
@@ -312,6 +70,35 @@ def main():
     # Sidebar configuration
     st.sidebar.header("Configuration")
     max_pages = st.sidebar.slider("Max pages to crawl", 1, 10, 5)
+    extraction_mode = st.sidebar.radio(
+        "Extraction mode",
+        ["Single call (schema)", "Summarize + extract"],
+        help="Single call sends the packed pages once with a JSON schema; "
+             "summarize + extract runs a map-reduce summary first."
+    )
+    hedge = st.sidebar.checkbox(
+        "Hedge slow requests",
+        value=fetch.HEDGING_ENABLED,
+        help="Send a duplicate request when a page takes longer than the host's p95 latency."
+    )
+    escalate = st.sidebar.checkbox(
+        "Escalate low-confidence fields",
+        value=True,
+        help="Re-query only missing or conflicting fields with the stronger models in "
+             "ENRICHMENT_MODELS (default: " + ", ".join(configured_models()) + ")."
+    )
+    
+    diagnostics_enabled = st.sidebar.checkbox(
+        "Diagnostics mode",
+        value=DIAGNOSTICS_ENABLED,
+        help="Profile each stage and trace memory per page; the report is written to "
+             "ENRICHMENT_DIAGNOSTICS_DIR (default: " + DIAGNOSTICS_DIR + ")."
+    )
+    
+    company_budget = st.sidebar.number_input(
+        "Token budget per company (0 = unlimited)", min_value=0, value=0, step=1000,
+        help="Prompts shrink and repairs/escalation are skipped as the budget runs out."
+    )
     
     # Main input
     url = st.text_input("Enter Company Website URL", placeholder="https://example.com")
@@ -321,60 +108,97 @@ def main():
             st.error("Please set your OPENAI_API_KEY in the .env file")
             return
         
-        with st.spinner("🔍 Crawling website and extracting data..."):
+        diagnostics = Diagnostics(enabled=diagnostics_enabled)
+        with st.spinner("🔍 Crawling website and extracting data..."), show_pipeline_logs():
             try:
-                scraper = EnhancedWebScraper(os.getenv("OPENAI_API_KEY"))
+                meter = TokenMeter(Budget(per_company_tokens=company_budget or None))
+                scraper = EnhancedWebScraper(
+                    os.getenv("OPENAI_API_KEY"), hedge=hedge, meter=meter, diagnostics=diagnostics
+                )
                 
                 # Progress tracking
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                # Step 1: Crawl website
+                # Placeholders that are filled in as results arrive
+                structured_placeholder = st.empty()
+                pages_expander = st.expander("📄 Pages scraped", expanded=True)
+                summary_placeholder = st.empty()
+                st.subheader("📋 Extracted Company Information")
+                info_placeholder = st.empty()
+                
+                # Skip dead and parked domains before spending crawl timeouts on them
+                status_text.text("Checking the website...")
+                triage = probe_domain(url)
+                if triage.status != 'live':
+                    st.error(f"Website looks {triage.status} ({triage.reason}); nothing to enrich")
+                    return
+                if triage.reason:
+                    st.info(f"Website {triage.reason}")
+                url = triage.final_url
+                
+                # Step 1: Crawl website, showing each page as it is scraped
                 status_text.text("Crawling priority pages...")
-                progress_bar.progress(25)
-                scraped_data = scraper.crawl_company_site(url, max_pages)
+                scraped_data = []
+                for page_data in scraper.iter_company_site(url, max_pages):
+                    scraped_data.append(page_data)
+                    progress_bar.progress(min(50, 50 * len(scraped_data) // max_pages))
+                    status_text.text(f"Scraped {len(scraped_data)}/{max_pages} pages...")
+                    pages_expander.write(f"{len(scraped_data)}. {page_data.url} ({page_data.text_length} chars)")
+                    render_structured_data(structured_placeholder, scraper.merge_structured_data(scraped_data))
                 
                 if not scraped_data:
                     st.error("Failed to extract content from the website")
                     return
                 
-                # Step 2: Create summary
-                status_text.text("Creating company summary...")
-                progress_bar.progress(50)
-                company_summary = scraper.create_company_summary(scraped_data)
+                streamed = []
                 
-                # Step 3: Extract structured info
-                status_text.text("Extracting structured information...")
-                progress_bar.progress(75)
-                company_info = scraper.extract_company_info(company_summary, url)
+                def show_token(token: str):
+                    streamed.append(token)
+                    info_placeholder.code(''.join(streamed), language="json")
+                
+                if extraction_mode == "Single call (schema)":
+                    # Step 2: One schema-constrained call over the packed pages
+                    status_text.text("Extracting structured information...")
+                    progress_bar.progress(75)
+                    company_info = scraper.extract_company_info_single_call(
+                        scraped_data, url, on_token=show_token, escalate=escalate
+                    )
+                    info_placeholder.code(company_info_json(company_info), language="json")
+                else:
+                    # Step 2: Create summary
+                    status_text.text("Creating company summary...")
+                    progress_bar.progress(50)
+                    company_summary = scraper.create_company_summary(scraped_data)
+                    with summary_placeholder.container():
+                        st.write("**Company Summary:**")
+                        st.write(company_summary['summary'])
+                    
+                    # Step 3: Extract structured info, streaming tokens into the page
+                    status_text.text("Extracting structured information...")
+                    progress_bar.progress(75)
+                    company_info = scraper.extract_company_info(company_summary, url, on_token=show_token)
+                    info_placeholder.code(company_info, language="json")
                 
                 progress_bar.progress(100)
                 status_text.text("✅ Enrichment complete!")
-                
-                # Display results
                 st.success("Company enrichment completed successfully!")
+                scraper.prober.cache.save()
                 
-                # Show the extracted JSON
-                st.subheader("📋 Extracted Company Information")
-                st.code(company_info, language="json")
-                
-                # Show additional insights
-                with st.expander("🔍 Additional Insights"):
-                    st.write("**Company Summary:**")
-                    st.write(company_summary['summary'])
-                    
-                    if company_summary['social_links']:
-                        st.write("**Social Media Presence:**")
-                        for platform, link in company_summary['social_links'].items():
-                            st.write(f"- {platform.title()}: {link}")
-                    
-                    st.write(f"**Pages Analyzed:** {len(scraped_data)}")
-                    for i, data in enumerate(scraped_data, 1):
-                        st.write(f"{i}. {data['url']}")
-                
+                usage = meter.totals('stage')
+                st.caption("Token usage: " + ", ".join(
+                    f"{stage} {totals['prompt_tokens']}+{totals['completion_tokens']} (${totals['cost']:.4f})"
+                    for stage, totals in usage.items()
+                ))
+                if diagnostics.enabled:
+                    st.caption(f"Diagnostics report written to {diagnostics.write_report()}")
+            
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
                 st.error("Please check your API key and try again.")
+            finally:
+                # Early returns and errors must not leave tracemalloc on in the long-lived Streamlit process
+                diagnostics.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,11 +1,11 @@
 import streamlit as st
-import requests
+import fetch
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 import os
 import json
 import re
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterator, List, Optional
 from dataclasses import dataclass
 from dotenv import load_dotenv
 
@@ -47,7 +47,7 @@ class EnhancedWebScraper:
             chunk_overlap=200,
             length_function=len
         )
-        
+    
     def get_domain(self, url: str) -> str:
         parsed = urlparse(url)
         return f"{parsed.scheme}://{parsed.netloc}"
@@ -105,22 +105,28 @@ class EnhancedWebScraper:
         return structured_data
     
     def get_priority_pages(self, base_url: str) -> List[str]:
-        print('base_url >>>>>>>>>>>>>>>>>>>>>>> '+ base_url)
-        """Get priority pages that are most likely to contain company info"""
-        r = requests.get(base_url, timeout=5)
-        print('r >>>>>>>>>>>>>>>>> ' + r)
-        root = ET.fromstring(r.content)
-        print('root >>>>>>>>>>>>>>>>> ' + root)
-        return [elem.text for elem in root.findall('.//{*}loc')]
-
+        """Get the pages listed in the site's sitemap, or the usual company pages without one"""
+        try:
+            r = fetch.get(urljoin(base_url, '/sitemap.xml'))
+            r.raise_for_status()
+            root = ET.fromstring(r.content)
+            pages = [elem.text.strip() for elem in root.findall('.//{*}loc') if elem.text and elem.text.strip()]
+        except Exception as e:
+            # Missing sitemaps and HTML error pages are common; fall back to the usual paths
+            st.info(f"No usable sitemap for {base_url} ({type(e).__name__}), crawling the usual pages")
+            pages = []
+        
+        if pages:
+            return pages
+        priority_paths = ['/about', '/about-us', '/company', '/contact', '/team', '/leadership', '/careers',
+                          '/services', '/products']
+        return [base_url] + [urljoin(base_url, path) for path in priority_paths]
     
+
     def scrape_page(self, url: str) -> Optional[Dict]:
         """Scrape a single page and return structured data"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(url, timeout=10, headers=headers)
+            response = fetch.get(url)
             response.raise_for_status()
             
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -142,28 +148,28 @@ class EnhancedWebScraper:
                 'text': text,
                 'structured_data': structured_data
             }
-            
+        
         except Exception as e:
             st.warning(f"Failed to scrape {url}: {str(e)}")
             return None
     
-    def crawl_company_site(self, base_url: str, max_pages: int = 10) -> List[Dict]:
-        """Crawl company website focusing on priority pages and additional discovered pages"""
+    def iter_company_site(self, base_url: str, max_pages: int = 10) -> Iterator[Dict]:
+        """Crawl company website, yielding each page as soon as it has been scraped"""
         base_domain = self.get_domain(base_url)
         priority_pages = self.get_priority_pages(base_domain)
-        print('priority_pages >>>>>>>>>>>>>>>>>>> ', priority_pages)
-        scraped_data = []
+        scraped_count = 0
         visited = set()
         to_visit = set(priority_pages)
         
         # First, scrape priority pages
-        while to_visit and len(scraped_data) < max_pages:
+        while to_visit and scraped_count < max_pages:
             page_url = to_visit.pop()
             if page_url not in visited:
                 page_data = self.scrape_page(page_url)
                 if page_data and page_data['text']:
-                    scraped_data.append(page_data)
+                    scraped_count += 1
                     visited.add(page_url)
+                    yield page_data
                     
                     # Discover additional pages
                     soup = BeautifulSoup(page_data['text'], 'html.parser')
@@ -172,8 +178,10 @@ class EnhancedWebScraper:
                         full_url = urljoin(base_url, href)
                         if urlparse(full_url).netloc == urlparse(base_url).netloc and full_url not in visited:
                             to_visit.add(full_url)
-        
-        return scraped_data
+    
+    def crawl_company_site(self, base_url: str, max_pages: int = 10) -> List[Dict]:
+        """Crawl company website focusing on priority pages and additional discovered pages"""
+        return list(self.iter_company_site(base_url, max_pages))
     
     def create_company_summary(self, scraped_data: List[Dict]) -> str:
         """Create a concise summary of company information using LangChain"""
@@ -247,8 +255,13 @@ class EnhancedWebScraper:
             'metadata': all_metadata
         }
     
-    def extract_company_info(self, company_data: Dict, base_url: str) -> str:
-        """Extract structured company information using the summary"""
+    def extract_company_info(self, company_data: Dict, base_url: str,
+                             on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Extract structured company information using the summary
+        
+        With ``on_token`` the completion is streamed and every token is
+        passed to it as it arrives.
+        """
         
         extraction_prompt = f"""
         Based on the following company information, extract structured data:
@@ -286,7 +299,14 @@ class EnhancedWebScraper:
         """
         
         try:
-            response = self.llm.predict(extraction_prompt)
+            if on_token is None:
+                response = self.llm.predict(extraction_prompt)
+            else:
+                tokens = []
+                for chunk in self.llm.stream(extraction_prompt):
+                    tokens.append(chunk.content)
+                    on_token(chunk.content)
+                response = ''.join(tokens)
             # Clean the response to ensure it's valid JSON
             response = response.strip()
             if response.startswith('```json'):
@@ -299,6 +319,29 @@ class EnhancedWebScraper:
             st.error(f"Error extracting company info: {str(e)}")
             return "{}"
 
+def merge_structured_data(scraped_data: List[Dict]) -> Dict:
+    """Merge the social links, contact info and metadata found on the pages so far"""
+    merged = {'social_links': {}, 'contact_info': {}, 'metadata': {}}
+    for data in scraped_data:
+        for key in merged:
+            merged[key].update(data.get('structured_data', {}).get(key, {}))
+    
+    return merged
+
+def render_structured_data(placeholder, structured_data: Dict):
+    """Render the deterministic fields found so far into a Streamlit placeholder"""
+    with placeholder.container():
+        st.subheader("⚡ Found on the website")
+        contact_info = structured_data['contact_info']
+        if contact_info.get('email'):
+            st.write(f"**Email:** {contact_info['email']}")
+        if contact_info.get('phone'):
+            st.write(f"**Phone:** {contact_info['phone']}")
+        for platform, link in structured_data['social_links'].items():
+            st.write(f"**{platform.title()}:** {link}")
+        if structured_data['metadata'].get('description'):
+            st.write(f"**Meta description:** {structured_data['metadata']['description']}")
+
 def main():
     st.title("🔎 Enhanced Company Enrichment Tool")
     st.markdown("*Powered by LangChain and intelligent web scraping*")
@@ -323,12 +366,51 @@ def main():
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                # Step 1: Crawl website
-                status_text.text("Crawling priority pages...")
-                progress_bar.progress(25)
-                scraped_data = scraper.crawl_company_site(url, max_pages)
+                # Placeholders that are filled in as results arrive
+                structured_placeholder = st.empty()
+                pages_expander = st.expander("📄 Pages scraped", expanded=True)
+                summary_placeholder = st.empty()
+                st.subheader("📋 Extracted Company Information")
+                info_placeholder = st.empty()
                 
-               
+                # Step 1: Crawl website, showing each page as it is scraped
+                status_text.text("Crawling sitemap pages...")
+                scraped_data = []
+                for page_data in scraper.iter_company_site(url, max_pages):
+                    scraped_data.append(page_data)
+                    progress_bar.progress(min(50, 50 * len(scraped_data) // max_pages))
+                    status_text.text(f"Scraped {len(scraped_data)}/{max_pages} pages...")
+                    pages_expander.write(f"{len(scraped_data)}. {page_data['url']} ({len(page_data['text'])} chars)")
+                    render_structured_data(structured_placeholder, merge_structured_data(scraped_data))
+                
+                if not scraped_data:
+                    st.error("Failed to extract content from the website")
+                    return
+                
+                # Step 2: Create summary
+                status_text.text("Creating company summary...")
+                progress_bar.progress(50)
+                company_summary = scraper.create_company_summary(scraped_data)
+                with summary_placeholder.container():
+                    st.write("**Company Summary:**")
+                    st.write(company_summary['summary'])
+                
+                # Step 3: Extract structured info, streaming tokens into the page
+                status_text.text("Extracting structured information...")
+                progress_bar.progress(75)
+                streamed = []
+                
+                def show_token(token: str):
+                    streamed.append(token)
+                    info_placeholder.code(''.join(streamed), language="json")
+                
+                company_info = scraper.extract_company_info(company_summary, url, on_token=show_token)
+                info_placeholder.code(company_info, language="json")
+                
+                progress_bar.progress(100)
+                status_text.text("✅ Enrichment complete!")
+                st.success("Company enrichment completed successfully!")
+            
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
                 st.error("Please check your API key and try again.")
@@ -1,47 +1,59 @@
-import os, re, requests, json, streamlit as st
+import os, re, streamlit as st
+import fetch
+from probing import PathProber
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin
 from dotenv import load_dotenv
 from langchain.chat_models import ChatOpenAI
+from langchain.schema import HumanMessage
+from langchain.callbacks import get_openai_callback
+from dataclasses import asdict
+from extraction import FUNCTION_NAME, company_info_function, invalid_fields, load_arguments, to_company_info
+from metering import TokenMeter
+from contacts import PIN_THRESHOLD, apply_pinned, best_values, extract_contacts, extract_json_ld, merge_candidates, unpinned_fields
 
 load_dotenv()
 llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.1, openai_api_key=os.getenv("OPENAI_API_KEY"))
+meter = TokenMeter()
+prober = PathProber()
 
 def extract_company_info(base_url):
-    headers = {'User-Agent': 'Mozilla'}
     paths = ["", "about", "contact", "team", "company", "legal"]
-    text, links, phone, email = '', {}, '', ''
-    for path in paths:
+    parts, links, found = [], {}, []
+    for result in prober.probe(base_url, [urljoin(base_url, f"/{path}") for path in paths]):
         try:
-            u = urljoin(base_url, f"/{path}")
-            r = requests.get(u, headers=headers, timeout=5)
-            if r.status_code != 200: continue
-            s = BeautifulSoup(r.text, 'html.parser')
-            text += re.sub(r'\s+', ' ', s.get_text(' ', strip=True)) + ' '
+            if not result.available: continue
+            # Probe bodies stop at the size cap; footers and contacts of long pages need the full page
+            html = fetch.get(result.url).text if result.truncated else result.html
+            s = BeautifulSoup(html, 'html.parser')
+            found.append(extract_contacts(s, base_url, extract_json_ld(s)))
+            for t in s(['script', 'style', 'noscript']): t.decompose()
+            parts.append(re.sub(r'\s+', ' ', s.get_text(' ', strip=True)))
             for a in s.find_all('a', href=True):
                 for k in ['linkedin','facebook','twitter','pinterest']:
                     if k in a['href'] and k not in links:
                         links[k] = urljoin(base_url, a['href'])
         except: continue
-    emails = re.findall(r'\b[\w.-]+@[\w.-]+\.\w+\b', text)
-    phones = re.findall(r'\+?\d[\d\s()-]{7,}\d', text)
-    email = emails[0] if emails else ''
-    phone = phones[0] if phones else ''
+    text = ' '.join(parts)
+    candidates = merge_candidates(found)
+    contact, pinned = best_values(candidates), best_values(candidates, PIN_THRESHOLD)
+    names = unpinned_fields(pinned)
     prompt = f"""
-From the following text and metadata, extract a JSON object with the following fields:
+From the following text and metadata, extract the company information and call {FUNCTION_NAME}:
 Text: {text[:12000]}
 Social: {links}
-Email: {email}
-Phone: {phone}
-Format:
-{{
-  "legal_name": "", "description": "", "industry": "", "employees": "", "annual_revenue": "",
-  "linkedin": "", "facebook": "", "twitter": "", "pinterest": "",
-  "address": {{"street": "", "city": "", "state": "", "zip": "", "country": ""}},
-  "sic_code": "", "phone": "", "email": ""
-}}"""
-    j = llm.predict(prompt).strip()
-    return json.loads(j[j.find('{'):j.rfind('}')+1])
+Contact: {contact}"""
+    def call(p, names=None):
+        with get_openai_callback() as cb:
+            m = llm.predict_messages([HumanMessage(content=p)], functions=[company_info_function(names)], function_call={'name': FUNCTION_NAME})
+        args = m.additional_kwargs.get('function_call', {}).get('arguments', '')
+        if cb.total_tokens: meter.record(base_url, "extract", llm.model_name, cb.prompt_tokens, cb.completion_tokens)
+        else: meter.record_text(base_url, "extract", llm.model_name, p, args)
+        return load_arguments(args)
+    data = call(prompt, names)
+    bad = invalid_fields(data, names)
+    if bad: data.update({k: v for k, v in call(f"{prompt}\nFix only these fields: {bad}", bad).items() if k in bad})
+    return asdict(apply_pinned(to_company_info(data), pinned))
 
 st.set_page_config(page_title="Company Info Extractor", layout="centered")
 st.title("🔍 Company Info Extractor")
@@ -50,7 +62,9 @@ if st.button("Extract") and url:
     with st.spinner("Extracting..."):
         try:
             data = extract_company_info(url)
+            prober.cache.save()
             st.success("Extraction complete!")
             st.json(data)
+            st.caption(f"Tokens used: {meter.company_tokens(url)}")
         except Exception as e:
             st.error(f"Error: {e}")
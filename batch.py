@@ -0,0 +1,332 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from benchmark import load_corpus
+from cascade import configured_models, fill_from_deterministic
+from contacts import apply_pinned, pinned_values, unpinned_fields
+from diagnostics import DIAGNOSTICS_ENABLED, Diagnostics
+from extraction import FUNCTION_NAME, company_info_function, load_arguments, to_company_info
+from fetch import canonical_domain
+from metering import Budget, TokenMeter, count_tokens
+from models import CompanyInfo
+from pipeline import EnhancedWebScraper
+from singleflight import SingleFlight
+from triage import live_sites, triage_domains
+
+TERMINAL_STATUSES = {'completed', 'failed', 'expired', 'cancelled'}
+
+# Completion size assumed when budgeting prompts before the batch has run
+EXPECTED_COMPLETION_TOKENS = 300
+
+# Batch API limits per batch; larger runs are split into several batches
+MAX_BATCH_REQUESTS = 50000
+MAX_BATCH_BYTES = 200 * 1024 * 1024
+
+_preparations = SingleFlight()
+
+class BatchTransport(Protocol):
+    """The subset of the Batch API used for deferred extraction"""
+    
+    def upload(self, content: bytes) -> str: ...
+    
+    def create(self, input_file_id: str) -> Dict: ...
+    
+    def retrieve(self, batch_id: str) -> Dict: ...
+    
+    def download(self, file_id: str) -> bytes: ...
+
+class HTTPBatchTransport:
+    """Batch API transport over plain HTTP
+    
+    Point ``base_url`` at a local stub server to exercise the whole flow
+    without touching the real API.
+    """
+    
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", timeout: float = 60):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['Authorization'] = f"Bearer {api_key}"
+    
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+    
+    def upload(self, content: bytes) -> str:
+        response = self._request(
+            'POST', '/files',
+            files={'file': ('batch_input.jsonl', content, 'application/jsonl')},
+            data={'purpose': 'batch'}
+        )
+        return response.json()['id']
+    
+    def create(self, input_file_id: str) -> Dict:
+        return self._request('POST', '/batches', json={
+            'input_file_id': input_file_id,
+            'endpoint': '/v1/chat/completions',
+            'completion_window': '24h'
+        }).json()
+    
+    def retrieve(self, batch_id: str) -> Dict:
+        return self._request('GET', f"/batches/{batch_id}").json()
+    
+    def download(self, file_id: str) -> bytes:
+        return self._request('GET', f"/files/{file_id}/content").content
+
+def build_batch_request(custom_id: str, prompt: str, model: str, field_names: Optional[List[str]] = None) -> Dict:
+    """Build one Batch API input line for a single-call extraction"""
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': '/v1/chat/completions',
+        'body': {
+            'model': model,
+            'temperature': 0.1,
+            'messages': [{'role': 'user', 'content': prompt}],
+            'functions': [company_info_function(field_names)],
+            'function_call': {'name': FUNCTION_NAME}
+        }
+    }
+
+def submit_batch(transport: BatchTransport, batch_requests: List[Dict]) -> Dict:
+    """Upload the requests as a JSONL file and create the batch"""
+    content = "\n".join(json.dumps(request) for request in batch_requests).encode('utf-8')
+    return transport.create(transport.upload(content))
+
+def split_batches(batch_requests: List[Dict], max_requests: int = MAX_BATCH_REQUESTS,
+                  max_bytes: int = MAX_BATCH_BYTES) -> List[List[Dict]]:
+    """Split requests into consecutive chunks within the per-batch request and input size limits"""
+    chunks, chunk, size = [], [], 0
+    for request in batch_requests:
+        # One JSONL line plus its newline separator
+        line_size = len(json.dumps(request).encode('utf-8')) + 1
+        if chunk and (len(chunk) >= max_requests or size + line_size > max_bytes):
+            chunks.append(chunk)
+            chunk, size = [], 0
+        chunk.append(request)
+        size += line_size
+    if chunk:
+        chunks.append(chunk)
+    
+    return chunks
+
+def submit_batches(transport: BatchTransport, batch_requests: List[Dict], max_requests: int = MAX_BATCH_REQUESTS,
+                   max_bytes: int = MAX_BATCH_BYTES) -> List[Dict]:
+    """
+    Submits the requests as one or more batches within the Batch API limits.
+    
+    :return: One ``{'id', 'custom_ids'}`` entry per submitted batch, for
+        joining each batch back to its slice of the manifest.
+    """
+    return [
+        {'id': submit_batch(transport, chunk)['id'], 'custom_ids': [request['custom_id'] for request in chunk]}
+        for chunk in split_batches(batch_requests, max_requests, max_bytes)
+    ]
+
+def wait_for_batch(transport: BatchTransport, batch_id: str, poll_interval: float = 60,
+                   on_status: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Poll a batch until it reaches a terminal status"""
+    while True:
+        batch = transport.retrieve(batch_id)
+        if on_status:
+            on_status(batch)
+        if batch['status'] in TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+def parse_batch_output(content: bytes) -> Dict[str, Dict]:
+    """Decode a batch output file into function-call payloads keyed by custom_id
+    
+    Lines whose request failed are mapped to an empty payload.
+    """
+    payloads = {}
+    for line in content.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get('response') or {}
+        if result.get('error') or response.get('status_code') != 200:
+            payloads[result['custom_id']] = {}
+            continue
+        message = response['body']['choices'][0]['message']
+        payloads[result['custom_id']] = load_arguments((message.get('function_call') or {}).get('arguments', ''))
+    
+    return payloads
+
+def parse_batch_usage(content: bytes) -> Dict[str, Tuple[str, int, int]]:
+    """Read ``(model, prompt_tokens, completion_tokens)`` per custom_id from a batch output file"""
+    usage = {}
+    for line in content.decode('utf-8').splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        body = (result.get('response') or {}).get('body') or {}
+        if body.get('usage'):
+            usage[result['custom_id']] = (
+                body.get('model', ''), body['usage']['prompt_tokens'], body['usage']['completion_tokens']
+            )
+    
+    return usage
+
+def collect_results(transport: BatchTransport, batch: Dict, manifest: Dict[str, Dict],
+                    meter: Optional[TokenMeter] = None) -> Dict[str, CompanyInfo]:
+    """Join a finished batch back to its companies by custom_id
+    
+    :param transport: Transport used to download the output file.
+    :param batch: The finished batch object.
+    :param manifest: ``custom_id`` -> ``{'url', 'inputs', 'structured_data'}`` written at submission.
+    :param meter: When given, the reported token usage is recorded per company.
+    :return: Input URL -> extracted CompanyInfo, for every input (aliases included) in the manifest.
+    """
+    content = transport.download(batch['output_file_id']) if batch.get('output_file_id') else b''
+    payloads = parse_batch_output(content)
+    if meter is not None:
+        for custom_id, (model, prompt_tokens, completion_tokens) in parse_batch_usage(content).items():
+            meter.record(manifest[custom_id]['url'], 'batch', model, prompt_tokens, completion_tokens)
+    
+    results = {}
+    for custom_id, entry in manifest.items():
+        structured_data = entry['structured_data']
+        info = fill_from_deterministic(to_company_info(payloads.get(custom_id, {})), structured_data)
+        info = apply_pinned(info, pinned_values(structured_data))
+        for input_url in entry.get('inputs', [entry['url']]):
+            results[input_url] = info
+    
+    return results
+
+def prepare_company(scraper: EnhancedWebScraper, url: str, max_pages: int) -> Optional[Dict]:
+    """Crawl one company and merge its scraped contact data
+    
+    Concurrent preparations of the same canonical domain share one crawl.
+    """
+    return _preparations.do(canonical_domain(url), _prepare_company, scraper, url, max_pages)
+
+def _prepare_company(scraper: EnhancedWebScraper, url: str, max_pages: int) -> Optional[Dict]:
+    pages = scraper.crawl_company_site(url, max_pages)
+    if not pages:
+        return None
+    return {
+        'url': url,
+        'pages': pages,
+        'structured_data': scraper.merge_structured_data(pages)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrich a list of companies through the OpenAI Batch API")
+    parser.add_argument('corpus', help="file with one company URL per line")
+    parser.add_argument('--workdir', default='batch_run', help="directory for the input, manifest and results")
+    parser.add_argument('--model', default=configured_models()[0])
+    parser.add_argument('--max-pages', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=8, help="concurrent site crawls")
+    parser.add_argument('--base-url', default="https://api.openai.com/v1", help="Batch API base URL")
+    parser.add_argument('--poll-interval', type=float, default=60)
+    parser.add_argument('--resume', metavar='BATCH_ID', nargs='?', const='',
+                        help="poll the batches already submitted from the workdir, or only BATCH_ID")
+    parser.add_argument('--budget-tokens', type=int, help="token budget for the whole batch")
+    parser.add_argument('--diagnostics', action='store_true',
+                        help="profile the crawl and write a report of the slowest and largest pages to the workdir")
+    args = parser.parse_args()
+    
+    load_dotenv()
+    api_key = os.getenv("OPENAI_API_KEY", "")
+    transport = HTTPBatchTransport(api_key, args.base_url)
+    os.makedirs(args.workdir, exist_ok=True)
+    manifest_path = os.path.join(args.workdir, 'manifest.json')
+    batches_path = os.path.join(args.workdir, 'batches.json')
+    meter = TokenMeter(Budget(per_batch_tokens=args.budget_tokens))
+    
+    if args.resume is not None:
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        batches = []
+        if os.path.exists(batches_path):
+            with open(batches_path) as batches_file:
+                batches = [entry for entry in json.load(batches_file) if args.resume in ('', entry['id'])]
+        if not batches:
+            # A batch id the workdir does not list (e.g. from a run before batches were split) covers the whole manifest
+            batches = [{'id': args.resume, 'custom_ids': list(manifest)}]
+    else:
+        diagnostics = Diagnostics(enabled=args.diagnostics or DIAGNOSTICS_ENABLED)
+        scraper = EnhancedWebScraper(api_key or "unused", diagnostics=diagnostics)
+        
+        # Only live, unique sites are crawled; aliases share their canonical site's result
+        triaged = triage_domains(load_corpus(args.corpus))
+        aliases = {}
+        for result in triaged:
+            if result.status == 'alias':
+                aliases.setdefault(result.alias_of, []).append(result.input_url)
+            elif result.status != 'live':
+                print(f"Skipping {result.input_url}: {result.status} ({result.reason})")
+        sites = live_sites(triaged)
+        
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            prepared = list(executor.map(lambda site: prepare_company(scraper, site.final_url, args.max_pages), sites))
+        scraper.prober.cache.save()
+        if diagnostics.enabled:
+            print(f"Diagnostics report written to {diagnostics.write_report(os.path.join(args.workdir, 'diagnostics'))}")
+        
+        # Prompts are packed in input order so later companies degrade first when the budget runs low
+        manifest, batch_requests = {}, []
+        for i, (site, company) in enumerate(zip(sites, prepared)):
+            if company is None:
+                print(f"Skipping {site.input_url}: no content")
+                continue
+            plan = meter.plan(company['url'], args.max_pages, escalate=False)
+            prompt = scraper.prepare_single_call_prompt(
+                company['pages'][:plan.max_pages], company['url'], plan.max_prompt_chars
+            )
+            meter.record(
+                company['url'], 'batch-estimate', args.model,
+                count_tokens(prompt, args.model), EXPECTED_COMPLETION_TOKENS, estimated=True
+            )
+            custom_id = f"company-{i:06d}"
+            manifest[custom_id] = {
+                'url': company['url'],
+                'inputs': [site.input_url] + aliases.get(site.input_url, []),
+                'structured_data': company['structured_data']
+            }
+            pinned = pinned_values(company['structured_data'])
+            batch_requests.append(build_batch_request(custom_id, prompt, args.model, unpinned_fields(pinned)))
+        
+        with open(os.path.join(args.workdir, 'batch_input.jsonl'), 'w') as input_file:
+            input_file.write("\n".join(json.dumps(request) for request in batch_requests))
+        with open(manifest_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        
+        batches = submit_batches(transport, batch_requests)
+        with open(batches_path, 'w') as batches_file:
+            json.dump(batches, batches_file)
+        print(f"Submitted {len(batches)} batch(es) ({', '.join(entry['id'] for entry in batches)}) "
+              f"with {len(batch_requests)} companies, ~{meter.batch_tokens()} tokens estimated")
+        meter = TokenMeter()
+    
+    # The batches run side by side on the API; each is joined back to its own manifest slice
+    results = {}
+    for entry in batches:
+        batch = wait_for_batch(
+            transport, entry['id'], args.poll_interval,
+            on_status=lambda b: print(f"Batch {b['id']}: {b['status']} {b.get('request_counts', {})}")
+        )
+        manifest_slice = {custom_id: manifest[custom_id] for custom_id in entry['custom_ids'] if custom_id in manifest}
+        results.update(collect_results(transport, batch, manifest_slice, meter))
+    for stage, totals in meter.totals('stage').items():
+        print(f"Usage ({stage}): {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion "
+              f"tokens, ${totals['cost']:.4f} before batch discount")
+    
+    results_path = os.path.join(args.workdir, 'results.jsonl')
+    with open(results_path, 'w') as results_file:
+        for url, info in results.items():
+            results_file.write(json.dumps({'url': url, **asdict(info)}) + "\n")
+    print(f"Wrote {len(results)} results to {results_path}")
+
+if __name__ == "__main__":
+    main()
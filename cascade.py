@@ -0,0 +1,164 @@
+import json
+import os
+import re
+from dataclasses import asdict, fields
+from typing import Dict, List, Optional
+
+from extraction import FUNCTION_NAME
+from models import ADDRESS_FIELDS, CompanyInfo
+
+# Cheapest model first; later entries are only asked about unresolved fields
+DEFAULT_MODELS = ['gpt-4o-mini', 'gpt-4o']
+
+MISSING_VALUES = {'', 'not found', 'n/a', 'na', 'none', 'unknown', 'null'}
+
+SOCIAL_FIELDS = ['linkedin', 'facebook', 'twitter', 'pinterest']
+
+CONFIDENCE_THRESHOLD = 0.5
+
+# Fields worth a stronger model when missing, and only when the site mentions them
+DEFAULT_ESCALATION_FIELDS = ['legal_name', 'description', 'employees', 'address']
+
+# Confidence of a value contradicting the deterministic data
+CONFLICT_CONFIDENCE = 0.2
+
+def configured_models() -> List[str]:
+    """Return the model cascade, configurable with ``ENRICHMENT_MODELS`` (comma separated)"""
+    models = [name.strip() for name in os.getenv("ENRICHMENT_MODELS", "").split(',') if name.strip()]
+    return models or list(DEFAULT_MODELS)
+
+def escalation_fields() -> List[str]:
+    """Fields escalated when missing, configurable with ``ENRICHMENT_ESCALATE_FIELDS`` (comma separated)"""
+    names = [name.strip() for name in os.getenv("ENRICHMENT_ESCALATE_FIELDS", "").split(',') if name.strip()]
+    return names or list(DEFAULT_ESCALATION_FIELDS)
+
+def is_missing(value) -> bool:
+    """True for empty values and the placeholders models use for them"""
+    if isinstance(value, dict):
+        return all(is_missing(value.get(key)) for key in ADDRESS_FIELDS)
+    return not isinstance(value, str) or value.strip().lower() in MISSING_VALUES
+
+def normalize_url(url: str) -> str:
+    url = re.sub(r'^https?://(www\.)?', '', url.strip().lower())
+    return url.rstrip('/')
+
+def normalize_phone(phone: str) -> str:
+    return re.sub(r'\D', '', phone)[-10:]
+
+def normalize_address(address: Dict) -> str:
+    """House number (or start of the street) and ZIP, enough to tell two addresses apart"""
+    street = (address.get('street') or '').lower()
+    number = re.match(r'\s*(\d+)', street)
+    key = number.group(1) if number else re.sub(r'[^a-z0-9]', '', street)[:12]
+    return f"{key}|{(address.get('zip') or '')[:5]}"
+
+def deterministic_values(structured_data: Dict) -> Dict[str, str]:
+    """Map CompanyInfo fields to the values found by ``extract_structured_data``"""
+    values = {name: structured_data['social_links'][name]
+              for name in SOCIAL_FIELDS if structured_data['social_links'].get(name)}
+    for name in ['email', 'phone', 'address']:
+        if structured_data['contact_info'].get(name):
+            values[name] = structured_data['contact_info'][name]
+    
+    return values
+
+def values_agree(field_name: str, value: str, deterministic: str) -> bool:
+    if field_name in SOCIAL_FIELDS:
+        return normalize_url(value) == normalize_url(deterministic)
+    if field_name == 'phone':
+        return normalize_phone(value) == normalize_phone(deterministic)
+    if field_name == 'address':
+        return normalize_address(value) == normalize_address(deterministic)
+    return value.strip().lower() == deterministic.strip().lower()
+
+def field_confidence(info: CompanyInfo, structured_data: Dict) -> Dict[str, float]:
+    """Score every field of an extraction result between 0 and 1
+    
+    Missing values score 0, values contradicting the deterministic data
+    score 0.2, values confirmed by it score 1 and anything else 0.7.
+    """
+    deterministic = deterministic_values(structured_data)
+    scores = {}
+    for field in fields(CompanyInfo):
+        value = getattr(info, field.name)
+        if is_missing(value):
+            scores[field.name] = 0.0
+        elif field.name in deterministic:
+            scores[field.name] = (1.0 if values_agree(field.name, value, deterministic[field.name])
+                                  else CONFLICT_CONFIDENCE)
+        else:
+            scores[field.name] = 0.7
+    
+    return scores
+
+def fill_from_deterministic(info: CompanyInfo, structured_data: Dict) -> CompanyInfo:
+    """Fill missing fields with deterministic values instead of asking another model"""
+    for field_name, value in deterministic_values(structured_data).items():
+        if is_missing(getattr(info, field_name)):
+            setattr(info, field_name, value)
+    
+    return info
+
+def unresolved_fields(info: CompanyInfo, structured_data: Dict, evidence: Optional[Dict[str, List[str]]] = None,
+                      field_names: Optional[List[str]] = None, threshold: float = CONFIDENCE_THRESHOLD) -> List[str]:
+    """
+    Returns the fields worth asking a stronger model about.
+    
+    Values contradicting the scraped contact data always qualify. A missing
+    value only does when it is one of ``field_names`` (``escalation_fields()``
+    by default) and ``evidence`` holds chunks mentioning it; an honest "Not
+    found" on a site that never mentions the field is left alone.
+    
+    :param info: Result of the first pass.
+    :param structured_data: Merged scraped data, for conflict checks.
+    :param evidence: Field name -> chunks mentioning it, from ``retrieval.field_evidence``.
+    :param field_names: Fields that may be escalated when missing.
+    :param threshold: Confidence below which a field counts as unresolved.
+    """
+    field_names = escalation_fields() if field_names is None else field_names
+    evidence = evidence or {}
+    unresolved = []
+    for name, score in field_confidence(info, structured_data).items():
+        if score >= threshold:
+            continue
+        if score == CONFLICT_CONFIDENCE or (name in field_names and evidence.get(name)):
+            unresolved.append(name)
+    
+    return unresolved
+
+def build_escalation_prompt(info: CompanyInfo, field_names: List[str], structured_data: Dict,
+                            evidence: Dict[str, List[str]], base_url: str) -> str:
+    """Build a prompt for the unresolved fields only, carrying just their evidence
+    
+    The packed pages are not resent; the stronger model sees the first-pass
+    values, the scraped values they conflict with and the chunks that
+    mention the missing fields.
+    """
+    previous = {name: asdict(info)[name] for name in field_names}
+    scraped = {name: value for name, value in deterministic_values(structured_data).items() if name in field_names}
+    chunks = []
+    for name in field_names:
+        for chunk in evidence.get(name, []):
+            if chunk not in chunks:
+                chunks.append(chunk)
+    excerpts = "\n\n".join(chunks) or "(none)"
+    return f"""Check these fields of the company behind {base_url}.
+
+A first pass returned: {json.dumps(previous)}
+Values scraped from the website: {json.dumps(scraped)}
+
+Relevant excerpts from the website:
+{excerpts}
+
+Call {FUNCTION_NAME} with values for these fields only. Prefer the scraped values unless the excerpts clearly contradict them; use "Not found" when the excerpts do not say."""
+
+def merge_escalation(info: CompanyInfo, escalated: CompanyInfo, field_names: List[str],
+                     structured_data: Dict) -> CompanyInfo:
+    """Take escalated values for ``field_names`` when they score at least as well"""
+    current = field_confidence(info, structured_data)
+    candidate = field_confidence(escalated, structured_data)
+    for name in field_names:
+        if candidate[name] > 0 and candidate[name] >= current[name]:
+            setattr(info, name, getattr(escalated, name))
+    
+    return info
@@ -0,0 +1,312 @@
+import json
+import re
+from dataclasses import fields
+from typing import Dict, Iterator, List, Optional
+
+from bs4 import BeautifulSoup
+
+from cascade import normalize_address, normalize_phone
+from fetch import canonical_domain
+from models import ADDRESS_FIELDS, CompanyInfo
+
+CONTACT_FIELDS = ('email', 'phone', 'address')
+
+# Values at or above this confidence are pinned and left out of the LLM schema
+PIN_THRESHOLD = 0.9
+
+# Values below this are kept as candidates but never used as the contact value
+MIN_CONFIDENCE = 0.5
+
+EMAIL_PATTERN = re.compile(r'\b[A-Za-z0-9._%+-]+@(?:[A-Za-z0-9-]+\.)+[A-Za-z]{2,}\b')
+
+# Asset names (logo@2x.png) and addresses of embedded vendors, trackers and templates
+IGNORED_EMAIL_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.css', '.js')
+IGNORED_EMAIL_DOMAINS = {
+    'example.com', 'example.org', 'domain.com', 'email.com', 'yourdomain.com', 'yourcompany.com',
+    'sentry.io', 'sentry.wixpress.com', 'wixpress.com', 'sentry-next.wixpress.com', 'godaddy.com',
+    'mailchimp.com', 'hubspot.com', 'squarespace.com', 'wordpress.com', 'w3.org', 'schema.org'
+}
+FREE_EMAIL_DOMAINS = {
+    'gmail.com', 'googlemail.com', 'outlook.com', 'hotmail.com', 'yahoo.com', 'icloud.com',
+    'aol.com', 'protonmail.com', 'proton.me', 'gmx.com', 'zoho.com'
+}
+ROLE_MAILBOXES = {'info', 'contact', 'hello', 'sales', 'office', 'enquiries', 'inquiries', 'support', 'admin'}
+NO_REPLY = re.compile(r'^no-?reply|^do-?not-?reply', re.IGNORECASE)
+
+PHONE_PATTERN = re.compile(
+    r'(?<![\w+])(?:\+\d{1,3}[\s.-]?)?(?:\(\d{1,5}\)[\s.-]?)?\d{2,5}(?:[\s.-]\d{2,5}){1,4}(?![\w-])'
+)
+PHONE_KEYWORDS = re.compile(r'(?:phone|tel|call|mobile|fax|contact)\W{0,3}$', re.IGNORECASE)
+DATE_LIKE = re.compile(r'^(?:\d{4}[-/. ]\d{1,2}[-/. ]\d{1,2}|\d{1,2}[-/. ]\d{1,2}[-/. ]\d{4}|(?:19|20)\d{2}\s*-\s*(?:19|20)\d{2})$')
+
+STREET_SUFFIXES = (
+    r'Street|St|Avenue|Ave|Road|Rd|Boulevard|Blvd|Drive|Dr|Lane|Ln|Way|Court|Ct|Place|Pl|'
+    r'Parkway|Pkwy|Highway|Hwy|Square|Sq|Terrace|Ter|Circle|Cir|Plaza'
+)
+US_ADDRESS_PATTERN = re.compile(
+    rf'(\d{{1,6}}\s+(?:[A-Za-z0-9.\'-]+\s+){{0,5}}(?:{STREET_SUFFIXES})\.?'
+    r'(?:,?\s+(?:Suite|Ste\.?|Unit|Floor|Fl\.?|#)\s*[\w-]+)?)'
+    r',?\s+([A-Za-z][A-Za-z .\'-]{1,40}?),\s*([A-Z]{2})\s+(\d{5}(?:-\d{4})?)\b'
+)
+
+SCHEMA_ADDRESS_KEYS = {
+    'streetAddress': 'street',
+    'addressLocality': 'city',
+    'addressRegion': 'state',
+    'postalCode': 'zip',
+    'addressCountry': 'country'
+}
+
+def candidate(value, confidence: float, source: str) -> Dict:
+    return {'value': value, 'confidence': round(min(confidence, 1.0), 2), 'source': source}
+
+def extract_json_ld(soup: BeautifulSoup) -> List[Dict]:
+    """Decode the JSON-LD blocks of a page; call before script tags are removed"""
+    blocks = []
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+        blocks.extend(data if isinstance(data, list) else [data])
+    
+    return [block for block in blocks if isinstance(block, dict)]
+
+def _walk(node) -> Iterator[Dict]:
+    """Yield every object nested in a JSON-LD block, @graph entries included"""
+    if isinstance(node, dict):
+        yield node
+        for value in node.values():
+            yield from _walk(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from _walk(value)
+
+def email_candidates(soup: BeautifulSoup, text: str, domain: str) -> List[Dict]:
+    """
+    Finds email addresses and ranks them by affinity with the site's domain.
+    
+    Addresses on the company's own domain score highest, free-mail
+    addresses are plausible for small businesses, and anything on another
+    domain is most likely a vendor, agency or tracking address.
+    
+    :param soup: Parsed page, searched for ``mailto:`` links.
+    :param text: Visible text of the page.
+    :param domain: Canonical domain of the company site.
+    :return: Candidates, best first.
+    """
+    found = {}
+    mailto = [link['href'][7:].split('?')[0] for link in soup.find_all('a', href=True)
+              if link['href'].lower().startswith('mailto:')]
+    for source, values in (('mailto', mailto), ('text', EMAIL_PATTERN.findall(text))):
+        for value in values:
+            email = value.strip().lower()
+            local, _, email_domain = email.partition('@')
+            if not EMAIL_PATTERN.fullmatch(email) or email.endswith(IGNORED_EMAIL_SUFFIXES):
+                continue
+            if email_domain in IGNORED_EMAIL_DOMAINS:
+                continue
+            
+            if email_domain == domain or email_domain.endswith('.' + domain):
+                confidence = 0.9
+            elif email_domain in FREE_EMAIL_DOMAINS:
+                confidence = 0.5
+            else:
+                confidence = 0.3
+            if source == 'mailto':
+                confidence += 0.05
+            if local in ROLE_MAILBOXES:
+                confidence += 0.05
+            elif NO_REPLY.match(local):
+                confidence -= 0.3
+            
+            if email not in found or found[email]['confidence'] < confidence:
+                found[email] = candidate(email, confidence, source)
+    
+    return sorted(found.values(), key=lambda c: -c['confidence'])
+
+def format_phone(raw: str) -> Optional[str]:
+    """Normalize a phone number, or return None if it cannot be one
+    
+    Numbers with a country code become E.164 (``+442079460958``); ten digit
+    North American numbers keep the ``(555) 123-4567`` form.
+    """
+    raw = raw.strip()
+    digits = re.sub(r'\D', '', raw)
+    if not 7 <= len(digits) <= 15 or len(set(digits)) == 1 or DATE_LIKE.match(raw):
+        return None
+    if raw.startswith('+') or raw.startswith('00'):
+        return '+' + (digits[2:] if raw.startswith('00') else digits)
+    if len(digits) == 11 and digits[0] == '1':
+        digits = digits[1:]
+    if len(digits) == 10 and digits[0] in '23456789':
+        return f"({digits[:3]}) {digits[3:6]}-{digits[6:]}"
+    return digits
+
+def phone_candidates(soup: BeautifulSoup, text: str) -> List[Dict]:
+    """Find phone numbers in ``tel:`` links and in the page text"""
+    found = {}
+    
+    def add(value: str, confidence: float, source: str):
+        key = normalize_phone(value)
+        if key not in found or found[key]['confidence'] < confidence:
+            found[key] = candidate(value, confidence, source)
+    
+    for link in soup.find_all('a', href=True):
+        if link['href'].lower().startswith('tel:'):
+            phone = format_phone(link['href'][4:])
+            if phone:
+                add(phone, 0.95, 'tel')
+    
+    for match in PHONE_PATTERN.finditer(text):
+        phone = format_phone(match.group())
+        if not phone:
+            continue
+        # Bare digit runs without a country code or North American shape are often IDs
+        if phone.startswith('+'):
+            confidence = 0.8
+        elif phone.startswith('('):
+            confidence = 0.7
+        else:
+            confidence = 0.4
+        if PHONE_KEYWORDS.search(text[max(0, match.start() - 20):match.start()]):
+            confidence += 0.1
+        add(phone, confidence, 'text')
+    
+    return sorted(found.values(), key=lambda c: -c['confidence'])
+
+def _schema_address(node: Dict) -> Optional[Dict]:
+    address = {field: '' for field in ADDRESS_FIELDS}
+    for key, field in SCHEMA_ADDRESS_KEYS.items():
+        value = node.get(key, '')
+        if isinstance(value, dict):
+            value = value.get('name', '')
+        address[field] = value.strip() if isinstance(value, str) else ''
+    return address if address['street'] else None
+
+def _parse_address(text: str) -> Optional[Dict]:
+    match = US_ADDRESS_PATTERN.search(re.sub(r'\s+', ' ', text))
+    if not match:
+        return None
+    street, city, state, zip_code = match.groups()
+    return {'street': street.strip(), 'city': city.strip(), 'state': state, 'zip': zip_code,
+            'country': 'United States'}
+
+def address_candidates(soup: BeautifulSoup, text: str, json_ld: Optional[List[Dict]] = None) -> List[Dict]:
+    """Find postal addresses in schema.org data, ``<address>`` tags and the page text"""
+    found = []
+    
+    for node in _walk(json_ld or []):
+        if node.get('@type') == 'PostalAddress' or 'streetAddress' in node:
+            address = _schema_address(node)
+            if address:
+                complete = address['city'] or address['zip']
+                found.append(candidate(address, 0.95 if complete else 0.6, 'json-ld'))
+    
+    for scope in soup.find_all(itemtype=re.compile(r'schema\.org/PostalAddress', re.IGNORECASE)):
+        address = _schema_address({
+            element['itemprop']: element.get('content') or element.get_text(' ', strip=True)
+            for element in scope.find_all(itemprop=True)
+        })
+        if address:
+            found.append(candidate(address, 0.9 if address['city'] or address['zip'] else 0.6, 'microdata'))
+    
+    for tag in soup.find_all('address'):
+        address = _parse_address(tag.get_text(', ', strip=True))
+        if address:
+            found.append(candidate(address, 0.8, 'address-tag'))
+    
+    address = _parse_address(text)
+    if address:
+        found.append(candidate(address, 0.6, 'text'))
+    
+    return merge_candidates([{'address': found}])['address']
+
+def candidate_key(field: str, value) -> str:
+    if field == 'address':
+        return normalize_address(value)
+    if field == 'phone':
+        return normalize_phone(value)
+    return value.lower()
+
+def extract_contacts(soup: BeautifulSoup, base_url: str, json_ld: Optional[List[Dict]] = None) -> Dict[str, List[Dict]]:
+    """
+    Runs the deterministic contact extractors over one page.
+    
+    :param soup: Parsed page; navigation and footer should still be present.
+    :param base_url: Page URL, used for email domain affinity.
+    :param json_ld: Blocks from ``extract_json_ld``, taken before scripts were removed.
+    :return: ``email``, ``phone`` and ``address`` candidates, each list best first.
+    """
+    text = soup.get_text(' ')
+    return {
+        'email': email_candidates(soup, text, canonical_domain(base_url)),
+        'phone': phone_candidates(soup, text),
+        'address': address_candidates(soup, text, json_ld)
+    }
+
+def corroborated(base: float, sources: List[str]) -> float:
+    """Add 0.05 per extra kind of source, without crossing a threshold the base did not reach
+    
+    Repeats of the same kind (a footer on every page) add nothing, a value
+    below ``MIN_CONFIDENCE`` (e.g. an email on another domain) stays below
+    it, and a value seen only in page text is never lifted to ``PIN_THRESHOLD``.
+    """
+    confidence = base + 0.05 * (len(set(sources)) - 1)
+    if base < MIN_CONFIDENCE:
+        confidence = min(confidence, MIN_CONFIDENCE - 0.01)
+    if base < PIN_THRESHOLD and set(sources) == {'text'}:
+        confidence = min(confidence, PIN_THRESHOLD - 0.01)
+    return confidence
+
+def merge_candidates(candidate_sets: List[Dict[str, List[Dict]]]) -> Dict[str, List[Dict]]:
+    """Combine candidates from several pages or sources
+    
+    The same value keeps its best score and gains a small bonus for each
+    distinct kind of source (mailto, tel, json-ld, text, ...) it was found
+    in. Merging is idempotent: merged candidates carry their base score and
+    sources, so merging per page and then across pages counts each once.
+    """
+    merged = {}
+    for field in CONTACT_FIELDS:
+        best = {}
+        for candidates in candidate_sets:
+            for c in candidates.get(field, []):
+                key = candidate_key(field, c['value'])
+                base = c.get('base_confidence', c['confidence'])
+                sources = c.get('sources', [c['source']])
+                if key not in best:
+                    best[key] = {**c, 'base_confidence': base, 'sources': sorted(set(sources))}
+                    continue
+                current = best[key]
+                winner = c if base > current['base_confidence'] else current
+                best[key] = {
+                    'value': winner['value'],
+                    'source': winner['source'],
+                    'base_confidence': max(base, current['base_confidence']),
+                    'sources': sorted(set(current['sources']) | set(sources))
+                }
+        for c in best.values():
+            c['confidence'] = round(min(corroborated(c['base_confidence'], c['sources']), 1.0), 2)
+        merged[field] = sorted(best.values(), key=lambda c: -c['confidence'])
+    
+    return merged
+
+def best_values(candidates: Dict[str, List[Dict]], min_confidence: float = MIN_CONFIDENCE) -> Dict:
+    """Pick the top candidate of each field scoring at least ``min_confidence``"""
+    return {field: values[0]['value'] for field, values in candidates.items()
+            if values and values[0]['confidence'] >= min_confidence}
+
+def pinned_values(structured_data: Dict, threshold: float = PIN_THRESHOLD) -> Dict:
+    """Return the contact values trusted enough to skip the LLM for"""
+    return best_values(structured_data.get('contact_candidates', {}), threshold)
+
+def unpinned_fields(pinned: Dict) -> List[str]:
+    """CompanyInfo fields the LLM still has to extract"""
+    return [field.name for field in fields(CompanyInfo) if field.name not in pinned]
+
+def apply_pinned(info: CompanyInfo, pinned: Dict) -> CompanyInfo:
+    for name, value in pinned.items():
+        setattr(info, name, value)
+    
+    return info
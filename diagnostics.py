@@ -0,0 +1,215 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterator, List, Optional
+
+# Opt-in: profiling and allocation tracing slow the pipeline down noticeably
+DIAGNOSTICS_ENABLED = os.getenv("ENRICHMENT_DIAGNOSTICS", "").lower() in ('1', 'true', 'yes')
+
+DIAGNOSTICS_DIR = os.getenv("ENRICHMENT_DIAGNOSTICS_DIR", "diagnostics")
+
+@dataclass
+class PageDiagnostics:
+    url: str
+    html_chars: int = 0
+    text_length: int = 0
+    fetch_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    peak_bytes: int = 0
+    
+    @contextmanager
+    def timing(self, attribute: str) -> Iterator[None]:
+        """Add the time spent in the block to ``attribute``"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, attribute, getattr(self, attribute) + time.perf_counter() - started)
+
+class Diagnostics:
+    """Opt-in profiling of the enrichment pipeline
+    
+    Every ``stage`` block is run under cProfile, and ``page`` and
+    ``snapshot`` blocks trace allocations with tracemalloc. ``write_report``
+    lists the slowest and most memory-hungry pages, ready to be added to the
+    benchmark corpus. When disabled every block is a no-op.
+    
+    Memory peaks are process wide, so with concurrent crawls a page's peak
+    includes whatever the other threads allocated at the same time.
+    """
+    
+    def __init__(self, enabled: bool = DIAGNOSTICS_ENABLED, top: int = 10):
+        self.enabled = enabled
+        self.top = top
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.profiles: Dict[str, List[cProfile.Profile]] = {}
+        self.stage_seconds: Dict[str, float] = {}
+        self.stage_calls: Dict[str, int] = {}
+        self.pages: List[PageDiagnostics] = []
+        self.snapshots: List[Dict] = []
+        # Only stop tracing on close if this instance turned it on
+        self._started_tracing = enabled and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+    
+    def close(self):
+        """Stop allocation tracing if this instance started it; later blocks are timed only"""
+        if self._started_tracing and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self._started_tracing = False
+    
+    def tracing(self) -> bool:
+        return self.enabled and tracemalloc.is_tracing()
+    
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Profile a pipeline stage; nested stages are timed but profiled by the outer one"""
+        if not self.enabled:
+            yield
+            return
+        
+        profile = None
+        if not getattr(self._local, 'profiling', False):
+            profile = cProfile.Profile()
+            self._local.profiling = True
+            profile.enable()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            if profile is not None:
+                profile.disable()
+                self._local.profiling = False
+            with self._lock:
+                self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + elapsed
+                self.stage_calls[name] = self.stage_calls.get(name, 0) + 1
+                if profile is not None:
+                    self.profiles.setdefault(name, []).append(profile)
+    
+    @contextmanager
+    def page(self, url: str) -> Iterator[PageDiagnostics]:
+        """Measure scraping one page; the caller fills in sizes and timings"""
+        record = PageDiagnostics(url)
+        if not self.enabled:
+            yield record
+            return
+        
+        tracing = self.tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+        try:
+            with self.stage('scrape'):
+                yield record
+        finally:
+            if tracing and tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                record.peak_bytes = max(0, peak - baseline)
+            with self._lock:
+                self.pages.append(record)
+    
+    @contextmanager
+    def snapshot(self, label: str) -> Iterator[None]:
+        """Record the allocation sites that grew the most during the block"""
+        if not self.tracing():
+            yield
+            return
+        
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            # Tracing may have been stopped by close() while the block ran
+            if tracemalloc.is_tracing():
+                _, peak = tracemalloc.get_traced_memory()
+                growth = tracemalloc.take_snapshot().compare_to(before, 'lineno')
+                with self._lock:
+                    self.snapshots.append({
+                        'label': label,
+                        'peak_bytes': peak,
+                        'top_allocations': [str(stat) for stat in growth[:self.top]]
+                    })
+    
+    def stage_stats(self, name: str) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self.profiles.get(name, []))
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+    
+    def report(self) -> Dict:
+        """Summarize stages, the worst pages and the allocation snapshots"""
+        stages = {}
+        for name in list(self.stage_seconds):
+            output = io.StringIO()
+            stats = self.stage_stats(name)
+            if stats is not None:
+                stats.stream = output
+                stats.sort_stats('cumulative').print_stats(self.top)
+            stages[name] = {
+                'calls': self.stage_calls[name],
+                'seconds': round(self.stage_seconds[name], 3),
+                'profile': output.getvalue()
+            }
+        
+        with self._lock:
+            pages = list(self.pages)
+        return {
+            'stages': stages,
+            'slowest_pages': [asdict(page) for page in
+                              sorted(pages, key=lambda p: -(p.fetch_seconds + p.parse_seconds))[:self.top]],
+            'largest_memory_pages': [asdict(page) for page in
+                                     sorted(pages, key=lambda p: -p.peak_bytes)[:self.top]],
+            'snapshots': list(self.snapshots)
+        }
+    
+    def write_report(self, directory: str = DIAGNOSTICS_DIR) -> str:
+        """
+        Writes the diagnostics report and per-stage profiles, then stops
+        allocation tracing (see :meth:`close`).
+        
+        ``report.json`` holds the summary, ``<stage>.prof`` the raw profiles
+        (for pstats or snakeviz) and ``benchmark_candidates.txt`` the worst
+        URLs in the format of ``benchmark_urls.txt``.
+        
+        :param directory: Output directory, created if needed.
+        :return: Path of ``report.json``.
+        """
+        os.makedirs(directory, exist_ok=True)
+        report = self.report()
+        self.close()
+        
+        for name in report['stages']:
+            stats = self.stage_stats(name)
+            if stats is not None:
+                stats.dump_stats(os.path.join(directory, f"{name}.prof"))
+        
+        lines = ["# Slowest and most memory-hungry pages from a diagnostics run"]
+        seen = set()
+        for page in report['slowest_pages'] + report['largest_memory_pages']:
+            if page['url'] not in seen:
+                seen.add(page['url'])
+                lines.append(f"# {page['html_chars']} chars html, {page['fetch_seconds']:.3f}s fetch, "
+                             f"{page['parse_seconds']:.3f}s parse, "
+                             f"{page['peak_bytes'] / 1024:.0f} KiB peak")
+                lines.append(page['url'])
+        with open(os.path.join(directory, 'benchmark_candidates.txt'), 'w') as candidates_file:
+            candidates_file.write("\n".join(lines) + "\n")
+        
+        report_path = os.path.join(directory, 'report.json')
+        with open(report_path, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        return report_path
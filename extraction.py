@@ -0,0 +1,145 @@
+import json
+from dataclasses import asdict, fields
+from typing import Dict, List, Optional
+
+from models import ADDRESS_FIELDS, CompanyInfo, PageRecord
+
+FUNCTION_NAME = "record_company_info"
+
+FIELD_DESCRIPTIONS = {
+    'legal_name': "Company legal name",
+    'description': "Brief business description",
+    'industry': "Industry sector",
+    'employees': "Employee count or range",
+    'annual_revenue': "Revenue information if available",
+    'linkedin': "LinkedIn URL",
+    'facebook': "Facebook URL",
+    'twitter': "Twitter/X URL",
+    'pinterest': "Pinterest URL",
+    'address': "Postal address of the company headquarters",
+    'sic_code': "SIC code if determinable",
+    'phone': "Phone number",
+    'email': "Email address"
+}
+
+PRIORITY_KEYWORDS = ['about', 'contact', 'company']
+
+def company_info_function(field_names: Optional[List[str]] = None) -> Dict:
+    """Build an OpenAI function-calling spec from the CompanyInfo dataclass
+    
+    :param field_names: Restrict the spec to these fields (used for repairs).
+    :return: A function definition for the ``functions`` request parameter.
+    """
+    properties = {}
+    for field in fields(CompanyInfo):
+        if field_names is not None and field.name not in field_names:
+            continue
+        if field.name == 'address':
+            properties['address'] = {
+                'type': 'object',
+                'description': FIELD_DESCRIPTIONS['address'],
+                'properties': {key: {'type': 'string'} for key in ADDRESS_FIELDS},
+                'required': list(ADDRESS_FIELDS)
+            }
+        else:
+            properties[field.name] = {
+                'type': 'string',
+                'description': FIELD_DESCRIPTIONS.get(field.name, field.name)
+            }
+    
+    return {
+        'name': FUNCTION_NAME,
+        'description': 'Record structured information about a company. Use "Not found" for missing values.',
+        'parameters': {
+            'type': 'object',
+            'properties': properties,
+            'required': list(properties)
+        }
+    }
+
+def pack_pages(scraped_data: List[PageRecord], max_chars: int = 12000) -> str:
+    """Pack scraped pages into a single prompt section, about/contact pages first"""
+    pages = sorted(
+        scraped_data,
+        key=lambda data: not any(keyword in data.url.lower() for keyword in PRIORITY_KEYWORDS)
+    )
+    
+    parts = []
+    remaining = max_chars
+    for data in pages:
+        if remaining <= 0:
+            break
+        text = data.text[:remaining]
+        parts.append(f"### {data.url}\n{text}")
+        remaining -= len(text)
+    
+    return "\n\n".join(parts)
+
+def build_single_call_prompt(packed_pages: str, structured_data: Dict, base_url: str) -> str:
+    """Build the prompt for one-shot extraction from packed page content"""
+    return f"""Extract structured information about the company behind this website.
+
+Website: {base_url}
+Social Links: {structured_data['social_links']}
+Contact Info: {structured_data['contact_info']}
+Metadata: {structured_data['metadata']}
+
+Website content:
+{packed_pages}
+
+Call {FUNCTION_NAME} with the extracted values. Use "Not found" for missing information."""
+
+def build_repair_prompt(payload: Dict, invalid_fields: List[str], base_prompt: str) -> str:
+    """Build a follow-up prompt asking the model to fix only the invalid fields"""
+    previous = {name: payload.get(name) for name in invalid_fields}
+    return f"""{base_prompt}
+
+A previous answer returned invalid values for these fields: {json.dumps(previous)}
+Call {FUNCTION_NAME} again with corrected values for these fields only."""
+
+def load_arguments(arguments: str) -> Dict:
+    """Decode function-call arguments, tolerating text around the JSON object"""
+    try:
+        payload = json.loads(arguments)
+    except (json.JSONDecodeError, TypeError):
+        start, end = (arguments or '').find('{'), (arguments or '').rfind('}')
+        try:
+            payload = json.loads(arguments[start:end + 1]) if start != -1 else {}
+        except json.JSONDecodeError:
+            payload = {}
+    
+    return payload if isinstance(payload, dict) else {}
+
+def invalid_fields(payload: Dict, field_names: Optional[List[str]] = None) -> List[str]:
+    """Return the names of fields that are missing or have the wrong shape"""
+    invalid = []
+    for field in fields(CompanyInfo):
+        if field_names is not None and field.name not in field_names:
+            continue
+        value = payload.get(field.name)
+        if field.name == 'address':
+            valid = isinstance(value, dict) and all(isinstance(value.get(key), str) for key in ADDRESS_FIELDS)
+        else:
+            valid = isinstance(value, str)
+        if not valid:
+            invalid.append(field.name)
+    
+    return invalid
+
+def to_company_info(payload: Dict) -> CompanyInfo:
+    """Build a CompanyInfo from the valid fields of a decoded payload"""
+    bad = set(invalid_fields(payload))
+    values = {}
+    for field in fields(CompanyInfo):
+        if field.name in bad:
+            continue
+        if field.name == 'address':
+            values['address'] = {key: payload['address'][key] for key in ADDRESS_FIELDS}
+        else:
+            values[field.name] = payload[field.name]
+    
+    return CompanyInfo(**values)
+
+def company_info_json(info: CompanyInfo) -> str:
+    """Serialize a CompanyInfo for display"""
+    return json.dumps(asdict(info), indent=2)
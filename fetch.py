@@ -0,0 +1,204 @@
+import math
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Optional, Tuple
+from urllib.parse import urlparse, urlunparse
+
+import requests
+
+from singleflight import SingleFlight
+
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+}
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Send a duplicate request when a fetch runs past the host's p95 latency
+HEDGING_ENABLED = os.getenv("ENRICHMENT_HEDGE_REQUESTS", "").lower() in ('1', 'true', 'yes')
+
+class HostLatencyTracker:
+    """Per-host latency histogram used to derive timeouts and hedge delays
+    
+    Only successful responses are recorded, so fast error pages cannot pull
+    a host's timeout down. Until ``min_samples`` are seen a host gets the default.
+    """
+    
+    def __init__(self, window: int = 200, min_samples: int = 5, default_timeout: float = 10,
+                 min_timeout: float = 3, max_timeout: float = 30, headroom: float = 3.0):
+        self.window = window
+        self.min_samples = min_samples
+        self.default_timeout = default_timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.headroom = headroom
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = {}
+    
+    def record(self, host: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(host, deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, host: str, pct: float) -> Optional[float]:
+        """Return the ``pct`` percentile latency of ``host``, or None without enough samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(host, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, math.ceil(pct / 100 * len(samples)) - 1)]
+    
+    def timeout_for(self, host: str) -> float:
+        p99 = self.percentile(host, 99)
+        if p99 is None:
+            return self.default_timeout
+        return min(self.max_timeout, max(self.min_timeout, p99 * self.headroom))
+    
+    def hedge_delay(self, host: str) -> Optional[float]:
+        return self.percentile(host, 95)
+    
+    def snapshot(self) -> Dict[str, Dict]:
+        """Sample count, p50, p95 and timeout for every host seen so far"""
+        with self._lock:
+            hosts = list(self._samples)
+        return {
+            host: {
+                'count': len(self._samples[host]),
+                'p50': self.percentile(host, 50),
+                'p95': self.percentile(host, 95),
+                'timeout': self.timeout_for(host)
+            }
+            for host in hosts
+        }
+
+latency = HostLatencyTracker()
+
+_fetches = SingleFlight()
+# Pool threads for hedged fetches; each running fetch holds a slot, so tasks never queue
+HEDGE_WORKERS = int(os.getenv("ENRICHMENT_HEDGE_WORKERS", "64"))
+_hedges = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedged-fetch')
+_hedge_slots = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+def normalize_input(url: str) -> str:
+    """Add a scheme to bare domains such as ``example.com``"""
+    url = url.strip()
+    return url if re.match(r'^https?://', url, re.IGNORECASE) else f"https://{url}"
+
+def site_domain(url: str) -> str:
+    """Lowercase host of a URL without port and leading ``www.``"""
+    host = (urlparse(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+def canonical_domain(url: str) -> str:
+    """Key identifying a company site, e.g. ``www.example.com/`` -> ``example.com``"""
+    return site_domain(normalize_input(url))
+
+def canonical_url(url: str) -> str:
+    """Normalize a URL so equivalent spellings of the same page compare equal
+    
+    Lowercases scheme and host, drops ``www.``, default ports, fragments and
+    trailing slashes, so ``https://www.example.com/`` and
+    ``https://example.com`` map to the same key.
+    """
+    url = normalize_input(url)
+    parsed = urlparse(url)
+    scheme = parsed.scheme.lower()
+    host = site_domain(url)
+    if parsed.port and parsed.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((scheme, host, path, '', parsed.query, ''))
+
+def record_response(url: str, response: requests.Response):
+    """Record the time to response headers against the requested host
+    
+    Redirect hops are included, body download is not, so streamed and
+    buffered requests measure the same thing. Error responses are skipped.
+    """
+    if response.status_code >= 400:
+        return
+    seconds = sum(hop.elapsed.total_seconds() for hop in response.history) + response.elapsed.total_seconds()
+    latency.record(urlparse(url).netloc, seconds)
+
+def timed_get(url: str, timeout: float, headers: Dict) -> requests.Response:
+    """GET a page and record its latency against the host"""
+    response = requests.get(url, timeout=timeout, headers=headers)
+    record_response(url, response)
+    return response
+
+def capped_get(url: str, timeout: float, headers: Dict, max_bytes: int) -> Tuple[requests.Response, bytes]:
+    """GET a page following redirects, reading at most ``max_bytes`` of the body"""
+    response = requests.get(url, timeout=timeout, headers=headers, stream=True)
+    record_response(url, response)
+    chunks, size = [], 0
+    try:
+        for chunk in response.iter_content(chunk_size=8192):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+    finally:
+        response.close()
+    return response, b''.join(chunks)[:max_bytes]
+
+def _run_in_slot(fetcher: Callable, url: str, timeout: float, headers: Dict, **kwargs):
+    try:
+        return fetcher(url, timeout, headers, **kwargs)
+    finally:
+        _hedge_slots.release()
+
+def hedged_get(url: str, timeout: float, headers: Dict, fetcher: Callable = timed_get, **kwargs):
+    """Run ``fetcher``, racing a duplicate request once it runs past the host's p95
+    
+    Without latency history for the host, or when every pool thread is busy,
+    the request runs unhedged on the caller's thread: a saturated pool never
+    delays primaries in its queue or adds duplicates on top of them.
+    """
+    delay = latency.hedge_delay(urlparse(url).netloc)
+    if delay is None or not _hedge_slots.acquire(blocking=False):
+        return fetcher(url, timeout, headers, **kwargs)
+    primary = _hedges.submit(_run_in_slot, fetcher, url, timeout, headers, **kwargs)
+    
+    done, _ = wait([primary], timeout=delay)
+    if done or not _hedge_slots.acquire(blocking=False):
+        return primary.result()
+    
+    pending = {primary, _hedges.submit(_run_in_slot, fetcher, url, timeout, headers, **kwargs)}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None or not pending:
+                return future.result()
+
+def fetch_capped(url: str, timeout: Optional[float] = None, max_bytes: int = 262144,
+                 headers: Optional[Dict] = None, hedge: Optional[bool] = None) -> Tuple[requests.Response, bytes]:
+    """GET a URL through the shared fetch layer, reading at most ``max_bytes`` of the body
+    
+    Like ``get``, concurrent requests for the same canonical URL (and cap)
+    share one fetch and slow ones are hedged. A body of exactly
+    ``max_bytes`` means the page was cut off.
+    """
+    timeout = timeout or latency.timeout_for(urlparse(url).netloc)
+    hedge = HEDGING_ENABLED if hedge is None else hedge
+    key = (canonical_url(url), max_bytes)
+    if hedge:
+        return _fetches.do(key, hedged_get, url, timeout, headers or HEADERS, fetcher=capped_get, max_bytes=max_bytes)
+    return _fetches.do(key, capped_get, url, timeout, headers or HEADERS, max_bytes=max_bytes)
+
+def get(url: str, timeout: Optional[float] = None, headers: Optional[Dict] = None,
+        hedge: Optional[bool] = None) -> requests.Response:
+    """GET a page through the shared fetch layer
+    
+    :param url: Page URL.
+    :param timeout: Fixed timeout; by default it is derived from the host's latency history.
+    :param headers: Request headers, a browser User-Agent by default.
+    :param hedge: Race a duplicate request past p95 latency; defaults to ``HEDGING_ENABLED``.
+    :return: The response, shared with concurrent requests for the same canonical URL.
+    """
+    timeout = timeout or latency.timeout_for(urlparse(url).netloc)
+    hedge = HEDGING_ENABLED if hedge is None else hedge
+    return _fetches.do(
+        canonical_url(url), hedged_get if hedge else timed_get, url, timeout, headers or HEADERS
+    )
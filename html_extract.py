@@ -1,4 +1,4 @@
-import requests
+import fetch
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, urlparse
 from typing import List, Dict
@@ -12,7 +12,7 @@ def get_all_urls(base_url: str) -> List[str]:
     :return: A list of URLs found on the website.
     """
     try:
-        response = requests.get(base_url, timeout=10)
+        response = fetch.get(base_url)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -38,7 +38,7 @@ def extract_data_from_url(url: str) -> Dict:
     :return: A dictionary containing the extracted data.
     """
     try:
-        response = requests.get(url, timeout=10)
+        response = fetch.get(url)
         response.raise_for_status()
         
         soup = BeautifulSoup(response.text, 'html.parser')
@@ -0,0 +1,158 @@
+import threading
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+import tiktoken
+
+# USD per million prompt / completion tokens
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00)
+}
+
+# Rough size of a token, used to turn token budgets into prompt sizes
+CHARS_PER_TOKEN = 4
+
+DEFAULT_PROMPT_CHARS = 12000
+
+@lru_cache(maxsize=None)
+def _encoding(model: str):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+def count_tokens(text: str, model: str) -> int:
+    """Count tokens with tiktoken, estimating from length if no encoding is available"""
+    try:
+        return len(_encoding(model).encode(text))
+    except Exception:
+        return len(text) // CHARS_PER_TOKEN + 1
+
+@dataclass
+class UsageRecord:
+    company: str
+    stage: str
+    model: str
+    prompt_tokens: int
+    completion_tokens: int
+    estimated: bool = False
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    @property
+    def cost(self) -> float:
+        # Longest matching prefix, so dated snapshots such as gpt-4o-2024-08-06 are priced too
+        prices = [name for name in MODEL_PRICES if self.model.startswith(name)]
+        prompt_price, completion_price = MODEL_PRICES[max(prices, key=len)] if prices else (0.0, 0.0)
+        return (self.prompt_tokens * prompt_price + self.completion_tokens * completion_price) / 1_000_000
+
+@dataclass
+class Budget:
+    """Token limits; ``None`` means unlimited"""
+    per_company_tokens: Optional[int] = None
+    per_batch_tokens: Optional[int] = None
+
+@dataclass
+class Plan:
+    """How much work a company may get under the current budget"""
+    max_pages: int
+    escalate: bool
+    max_prompt_chars: int = DEFAULT_PROMPT_CHARS
+    allow_repairs: bool = True
+    notes: List[str] = field(default_factory=list)
+
+def _empty_totals() -> Dict:
+    return {'prompt_tokens': 0, 'completion_tokens': 0, 'cost': 0.0, 'calls': 0}
+
+class TokenMeter:
+    """Records LLM token usage per company and stage and enforces budgets
+    
+    Budgets never make an enrichment fail: as they run out, companies get
+    fewer pages, smaller prompts and no escalation to stronger models.
+    """
+    
+    def __init__(self, budget: Optional[Budget] = None, keep_records: bool = False):
+        self.budget = budget or Budget()
+        self.keep_records = keep_records
+        self._lock = threading.Lock()
+        # Raw records are only kept on request; budgets and reports use the running totals
+        self.records: List[UsageRecord] = []
+        self._company_tokens: Dict[str, int] = defaultdict(int)
+        self._batch_tokens = 0
+        self._totals = {key: defaultdict(_empty_totals) for key in ('company', 'stage', 'model')}
+    
+    def record(self, company: str, stage: str, model: str, prompt_tokens: int,
+               completion_tokens: int, estimated: bool = False) -> UsageRecord:
+        usage = UsageRecord(company, stage, model, prompt_tokens, completion_tokens, estimated)
+        with self._lock:
+            if self.keep_records:
+                self.records.append(usage)
+            self._company_tokens[company] += usage.total_tokens
+            self._batch_tokens += usage.total_tokens
+            for key, totals in self._totals.items():
+                entry = totals[getattr(usage, key)]
+                entry['prompt_tokens'] += prompt_tokens
+                entry['completion_tokens'] += completion_tokens
+                entry['cost'] += usage.cost
+                entry['calls'] += 1
+        return usage
+    
+    def record_text(self, company: str, stage: str, model: str, prompt: str, completion: str) -> UsageRecord:
+        """Record a call whose usage was not reported, counting tokens with tiktoken"""
+        return self.record(
+            company, stage, model, count_tokens(prompt, model), count_tokens(completion, model), estimated=True
+        )
+    
+    def company_tokens(self, company: str) -> int:
+        with self._lock:
+            return self._company_tokens.get(company, 0)
+    
+    def batch_tokens(self) -> int:
+        with self._lock:
+            return self._batch_tokens
+    
+    def totals(self, key: str = 'stage') -> Dict[str, Dict]:
+        """Aggregate tokens and cost by ``company``, ``stage`` or ``model``"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self._totals[key].items()}
+    
+    def allows(self, company: str) -> bool:
+        """True while the company and the batch are both within budget"""
+        if self.budget.per_company_tokens is not None and self.company_tokens(company) >= self.budget.per_company_tokens:
+            return False
+        if self.budget.per_batch_tokens is not None and self.batch_tokens() >= self.budget.per_batch_tokens:
+            return False
+        return True
+    
+    def plan(self, company: str, max_pages: int, escalate: bool = True) -> Plan:
+        """Degrade the work planned for a company according to the remaining budget"""
+        plan = Plan(max_pages=max_pages, escalate=escalate)
+        
+        if self.budget.per_company_tokens is not None:
+            remaining = max(0, self.budget.per_company_tokens - self.company_tokens(company))
+            # Leave room for the function spec and the completion
+            plan.max_prompt_chars = min(plan.max_prompt_chars, int(remaining * 0.6) * CHARS_PER_TOKEN)
+        
+        if self.budget.per_batch_tokens is not None:
+            # A zero budget is exhausted from the start
+            left = 1 - self.batch_tokens() / self.budget.per_batch_tokens if self.budget.per_batch_tokens > 0 else 0
+            if left < 0.5:
+                plan.escalate = False
+                plan.notes.append("batch budget below 50%: no escalation")
+            if left < 0.25:
+                plan.max_pages = max(1, max_pages // 2)
+                plan.max_prompt_chars = min(plan.max_prompt_chars, DEFAULT_PROMPT_CHARS // 2)
+                plan.notes.append("batch budget below 25%: fewer pages, smaller prompt")
+            if left <= 0:
+                plan.max_pages = 1
+                plan.allow_repairs = False
+                plan.notes.append("batch budget exhausted: single page, single call")
+        
+        # Always send something; an answer from a tiny prompt beats no answer
+        plan.max_prompt_chars = max(plan.max_prompt_chars, DEFAULT_PROMPT_CHARS // 4)
+        return plan
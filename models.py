@@ -0,0 +1,51 @@
+import sys
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict
+from urllib.parse import urlparse
+
+ADDRESS_FIELDS = ('street', 'city', 'state', 'zip', 'country')
+
+@dataclass
+class CompanyInfo:
+    legal_name: str = ""
+    description: str = ""
+    industry: str = ""
+    employees: str = ""
+    annual_revenue: str = ""
+    linkedin: str = ""
+    facebook: str = ""
+    twitter: str = ""
+    pinterest: str = ""
+    address: Dict = None
+    sic_code: str = ""
+    phone: str = ""
+    email: str = ""
+
+@dataclass(slots=True)
+class PageRecord:
+    """A scraped page kept compact for large batch runs
+    
+    The cleaned text is stored zlib-compressed and only inflated when
+    ``text`` is read; URL and host strings are interned so pages of the
+    same site share them.
+    """
+    url: str
+    host: str
+    compressed_text: bytes
+    text_length: int
+    structured_data: Dict = field(default_factory=dict)
+    
+    @classmethod
+    def from_text(cls, url: str, text: str, structured_data: Dict = None) -> 'PageRecord':
+        return cls(
+            url=sys.intern(url),
+            host=sys.intern(urlparse(url).netloc),
+            compressed_text=zlib.compress(text.encode('utf-8')),
+            text_length=len(text),
+            structured_data=structured_data or {}
+        )
+    
+    @property
+    def text(self) -> str:
+        return zlib.decompress(self.compressed_text).decode('utf-8')
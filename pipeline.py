@@ -0,0 +1,553 @@
+import copy
+import json
+import logging
+import re
+from typing import Callable, Dict, Iterator, List, Optional
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+# LangChain imports
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.schema import Document, HumanMessage
+from langchain.chains.summarize import load_summarize_chain
+from langchain.chat_models import ChatOpenAI
+from langchain.prompts import PromptTemplate
+from langchain.callbacks import get_openai_callback
+
+from models import CompanyInfo, PageRecord
+from extraction import (
+    FUNCTION_NAME, build_repair_prompt, build_single_call_prompt, company_info_function,
+    invalid_fields, load_arguments, pack_pages, to_company_info
+)
+from retrieval import build_index, field_evidence, retrieve_field_chunks
+import fetch
+from fetch import canonical_domain, canonical_url
+from metering import DEFAULT_PROMPT_CHARS, TokenMeter
+from diagnostics import Diagnostics
+from probing import PathProber
+from singleflight import SingleFlight
+from contacts import (
+    apply_pinned, best_values, extract_contacts, extract_json_ld, merge_candidates, pinned_values, unpinned_fields
+)
+from cascade import (
+    build_escalation_prompt, configured_models, escalation_fields, fill_from_deterministic, merge_escalation,
+    unresolved_fields
+)
+
+# Failures are logged rather than raised so one bad page or call never sinks an enrichment
+logger = logging.getLogger(__name__)
+
+# Whole enrichments in flight, keyed by canonical domain and crawl options
+_enrichments = SingleFlight()
+
+class EnhancedWebScraper:
+    def __init__(self, openai_api_key: str, models: Optional[List[str]] = None,
+                 hedge: Optional[bool] = None, meter: Optional[TokenMeter] = None,
+                 prober: Optional[PathProber] = None, diagnostics: Optional[Diagnostics] = None):
+        # Model cascade, cheapest first; self.llm is used for everything but escalation
+        self.llms = [
+            ChatOpenAI(
+                model=model,
+                temperature=0.1,
+                openai_api_key=openai_api_key
+            )
+            for model in (models or configured_models())
+        ]
+        self.llm = self.llms[0]
+        self.hedge = hedge
+        self.meter = meter or TokenMeter()
+        self.prober = prober or PathProber(hedge=hedge)
+        # Profiles and allocation traces are only collected when enabled (ENRICHMENT_DIAGNOSTICS)
+        self.diagnostics = diagnostics or Diagnostics()
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=2000,
+            chunk_overlap=200,
+            length_function=len
+        )
+    
+    def get_domain(self, url: str) -> str:
+        parsed = urlparse(url)
+        return f"{parsed.scheme}://{parsed.netloc}"
+    
+    def extract_structured_data(self, soup: BeautifulSoup, base_url: str,
+                                json_ld: Optional[List[Dict]] = None) -> Dict:
+        """Extract structured data from HTML elements
+        
+        Emails, phones and addresses come from the deterministic extractors
+        in ``contacts``; ``contact_info`` holds the best value of each and
+        ``contact_candidates`` every value found with its confidence.
+        """
+        structured_data = {
+            'social_links': {},
+            'contact_info': {},
+            'metadata': {}
+        }
+        
+        # Extract social media links
+        social_patterns = {
+            'linkedin': r'linkedin\.com',
+            'facebook': r'facebook\.com',
+            'twitter': r'twitter\.com|x\.com',
+            'pinterest': r'pinterest\.com',
+            'instagram': r'instagram\.com',
+            'youtube': r'youtube\.com'
+        }
+        
+        for link in soup.find_all('a', href=True):
+            href = link.get('href', '')
+            full_url = urljoin(base_url, href)
+            
+            for platform, pattern in social_patterns.items():
+                if re.search(pattern, full_url, re.IGNORECASE):
+                    structured_data['social_links'][platform] = full_url
+                    break
+        
+        # Extract contact information, ranked by confidence
+        candidates = extract_contacts(soup, base_url, json_ld)
+        structured_data['contact_candidates'] = candidates
+        structured_data['contact_info'] = best_values(candidates)
+        
+        # Extract meta tags
+        meta_tags = soup.find_all('meta')
+        for tag in meta_tags:
+            name = tag.get('name', '').lower()
+            content = tag.get('content', '')
+            if name in ['description', 'keywords'] and content:
+                structured_data['metadata'][name] = content
+        
+        return structured_data
+    
+    def get_priority_pages(self, base_url: str) -> List[str]:
+        """Get priority pages that are most likely to contain company info"""
+        priority_paths = [
+            '', '/', '/about', '/about-us', '/company', '/contact', 
+            '/team', '/leadership', '/careers', '/services', '/products'
+        ]
+        
+        pages = []
+        for path in priority_paths:
+            if path == '' or path == '/':
+                pages.append(base_url)
+            else:
+                pages.append(urljoin(base_url, path))
+        
+        return pages
+    
+
+    def scrape_page(self, url: str, html: Optional[str] = None, fetch_seconds: float = 0.0) -> Optional[PageRecord]:
+        """Scrape a single page and return structured data
+        
+        ``html`` skips the request when the page was already fetched by the
+        prober; ``fetch_seconds`` is the time the prober spent on it.
+        """
+        try:
+            with self.diagnostics.page(url) as page_diagnostics:
+                page_diagnostics.fetch_seconds += fetch_seconds
+                if html is None:
+                    with page_diagnostics.timing('fetch_seconds'):
+                        # Concurrent scrapes of the same canonical URL share one request; the
+                        # timeout comes from the host's latency history
+                        response = fetch.get(url, hedge=self.hedge)
+                        response.raise_for_status()
+                        html = response.text
+                page_diagnostics.html_chars = len(html)
+                
+                with page_diagnostics.timing('parse_seconds'):
+                    page_data = self.parse_page(url, html)
+                page_diagnostics.text_length = page_data.text_length
+                return page_data
+        
+        except Exception as e:
+            logger.warning("Failed to scrape %s: %s", url, e)
+            return None
+    
+    def parse_page(self, url: str, html: str) -> PageRecord:
+        """Turn a page's HTML into clean text and structured data"""
+        soup = BeautifulSoup(html, 'html.parser')
+        json_ld = extract_json_ld(soup)
+        
+        # Remove unwanted elements; contact details often live in the footer,
+        # so navigation is only dropped once structured data is extracted
+        for element in soup(['script', 'style', 'noscript']):
+            element.decompose()
+        
+        # Extract structured data
+        structured_data = self.extract_structured_data(soup, url, json_ld)
+        
+        for element in soup(['nav', 'footer', 'header']):
+            element.decompose()
+        
+        # Get clean text
+        text = soup.get_text(separator=' ', strip=True)
+        # Clean up whitespace
+        text = re.sub(r'\s+', ' ', text).strip()
+        
+        return PageRecord.from_text(url, text, structured_data)
+    
+    def iter_company_site(self, base_url: str, max_pages: int = 10) -> Iterator[PageRecord]:
+        """Crawl company website, yielding each page as soon as it has been scraped
+        
+        Pages are tracked by canonical URL, so spellings such as ``base_url``
+        and ``base_url/`` are fetched only once. Priority pages are probed
+        concurrently first; missing paths and soft-404 pages are dropped.
+        """
+        base_domain = self.get_domain(base_url)
+        probed = self.prober.probe(base_domain, self.get_priority_pages(base_domain))
+        
+        scraped_count = 0
+        visited = set()
+        # Pages cut off at the probe's size cap are fetched again in full by scrape_page
+        prefetched = {canonical_url(result.url): result.html for result in probed
+                      if result.available and not result.truncated}
+        probe_seconds = {canonical_url(result.url): result.fetch_seconds for result in probed if result.available}
+        to_visit = {canonical_url(result.url): result.url for result in probed if result.available}
+        
+        # First, scrape priority pages
+        while to_visit and scraped_count < max_pages:
+            page_key = next(iter(to_visit))
+            page_url = to_visit.pop(page_key)
+            if page_key not in visited:
+                visited.add(page_key)
+                page_data = self.scrape_page(page_url, prefetched.pop(page_key, None),
+                                             probe_seconds.pop(page_key, 0.0))
+                if page_data and page_data.text_length:
+                    scraped_count += 1
+                    yield page_data
+                    
+                    # Discover additional pages
+                    soup = BeautifulSoup(page_data.text, 'html.parser')
+                    for link in soup.find_all('a', href=True):
+                        href = link.get('href', '')
+                        full_url = urljoin(base_url, href)
+                        full_key = canonical_url(full_url)
+                        if urlparse(full_url).netloc == urlparse(base_url).netloc and full_key not in visited:
+                            to_visit.setdefault(full_key, full_url)
+    
+    def crawl_company_site(self, base_url: str, max_pages: int = 10) -> List[PageRecord]:
+        """Crawl company website focusing on priority pages and additional discovered pages"""
+        return list(self.iter_company_site(base_url, max_pages))
+    
+    def merge_structured_data(self, scraped_data: List[PageRecord]) -> Dict:
+        """Merge social links, contact info and metadata found across pages"""
+        merged = {
+            'social_links': {},
+            'contact_info': {},
+            'metadata': {}
+        }
+        
+        for data in scraped_data:
+            structured = data.structured_data
+            merged['social_links'].update(structured.get('social_links', {}))
+            merged['metadata'].update(structured.get('metadata', {}))
+        
+        # Contact values are ranked across pages rather than taken from the last one
+        merged['contact_candidates'] = merge_candidates(
+            [data.structured_data.get('contact_candidates', {}) for data in scraped_data]
+        )
+        merged['contact_info'] = best_values(merged['contact_candidates'])
+        
+        return merged
+    
+    def retrieve_relevant_content(self, scraped_data: List[PageRecord], k: int = 3,
+                                  max_chars: Optional[int] = None) -> List[PageRecord]:
+        """Keep only the chunks most relevant to the target fields
+        
+        Pages are split with ``self.text_splitter`` and ranked with a local
+        BM25 index, so details deep inside a long page still reach the LLM.
+        ``max_chars`` is filled by rank with whole chunks. Falls back to the
+        full pages when nothing matches.
+        """
+        index = build_index(scraped_data, self.text_splitter)
+        return retrieve_field_chunks(index, k, max_chars=max_chars) or scraped_data
+    
+    def record_usage(self, company: str, stage: str, llm: ChatOpenAI, prompt: str, completion: str, callback):
+        """Attribute one LLM call's tokens to a company and stage
+        
+        Uses the usage reported by the API and falls back to counting the
+        prompt and completion with tiktoken (e.g. for streamed responses).
+        """
+        if callback.total_tokens:
+            self.meter.record(company, stage, llm.model_name, callback.prompt_tokens, callback.completion_tokens)
+        else:
+            self.meter.record_text(company, stage, llm.model_name, prompt, completion)
+    
+    def create_company_summary(self, scraped_data: List[PageRecord]) -> str:
+        """Create a concise summary of company information using LangChain"""
+        with self.diagnostics.stage('summary'), self.diagnostics.snapshot(f"summary {scraped_data[0].url}"):
+            return self._create_company_summary(scraped_data)
+    
+    def _create_company_summary(self, scraped_data: List[PageRecord]) -> str:
+        # Combine all structured data
+        merged = self.merge_structured_data(scraped_data)
+        
+        # Prepare documents for summarization from the field-relevant chunks, shrunk
+        # with the remaining token budget like the single-call prompt
+        plan = self.meter.plan(canonical_domain(scraped_data[0].url), len(scraped_data), escalate=False)
+        documents = []
+        for data in self.retrieve_relevant_content(scraped_data, max_chars=plan.max_prompt_chars):
+            # Prioritize about and contact pages
+            priority_score = 1.0
+            if any(keyword in data.url.lower() for keyword in ['about', 'contact', 'company']):
+                priority_score = 2.0
+            
+            doc = Document(
+                page_content=data.text,
+                metadata={
+                    'url': data.url,
+                    'priority': priority_score
+                }
+            )
+            documents.append(doc)
+        
+        # Create summary prompt
+        summary_prompt = PromptTemplate(
+            template="""
+            Analyze the following company website content and extract key information:
+            
+            {text}
+            
+            Focus on identifying:
+            1. Company name and legal entity name
+            2. Business description and industry
+            3. Company size indicators (employees, revenue mentions)
+            4. Key services or products
+            5. Location/address information
+            
+            Provide a concise summary in 3-4 sentences focusing on the most important company details.
+            """,
+            input_variables=["text"]
+        )
+        
+        # Use map-reduce for large content
+        if len(documents) > 1:
+            summarize_chain = load_summarize_chain(
+                self.llm,
+                chain_type="map_reduce",
+                map_prompt=summary_prompt,
+                combine_prompt=PromptTemplate(
+                    template="Combine the following summaries into a comprehensive company profile:\n\n{text}",
+                    input_variables=["text"]
+                )
+            )
+            with get_openai_callback() as callback:
+                summary = summarize_chain.run(documents)
+        else:
+            with get_openai_callback() as callback:
+                summary = self.llm.predict(summary_prompt.format(text=documents[0].page_content))
+        self.record_usage(
+            canonical_domain(scraped_data[0].url), 'summary', self.llm,
+            ''.join(doc.page_content for doc in documents), summary, callback
+        )
+        
+        return {
+            'summary': summary,
+            'social_links': merged['social_links'],
+            'contact_info': merged['contact_info'],
+            'metadata': merged['metadata']
+        }
+    
+    def build_extraction_prompt(self, company_data: Dict, base_url: str) -> str:
+        """Build the prompt that turns the company summary into a JSON object"""
+        return f"""
+        Based on the following company information, extract structured data:
+        
+        Website: {base_url}
+        Summary: {company_data['summary']}
+        Social Links: {company_data['social_links']}
+        Contact Info: {company_data['contact_info']}
+        Metadata: {company_data['metadata']}
+        
+        Extract and return ONLY a JSON object with these exact keys:
+        {{
+            "legal_name": "Company legal name",
+            "description": "Brief business description",
+            "industry": "Industry sector",
+            "employees": "Employee count or range",
+            "annual_revenue": "Revenue information if available",
+            "linkedin": "LinkedIn URL",
+            "facebook": "Facebook URL", 
+            "twitter": "Twitter/X URL",
+            "pinterest": "Pinterest URL",
+            "address": {{
+                "street": "Street address",
+                "city": "City",
+                "state": "State",
+                "zip": "ZIP code",
+                "country": "Country"
+            }},
+            "sic_code": "SIC code if determinable",
+            "phone": "Phone number",
+            "email": "Email address"
+        }}
+        
+        Use "Not found" for missing information. Return only the JSON object.
+        """
+    
+    def clean_json_response(self, response: str) -> str:
+        """Strip markdown code fences the model may wrap around its JSON"""
+        response = response.strip()
+        if response.startswith('```json'):
+            response = response[7:-3]
+        elif response.startswith('```'):
+            response = response[3:-3]
+        
+        return response
+    
+    def extract_company_info(self, company_data: Dict, base_url: str,
+                             on_token: Optional[Callable[[str], None]] = None) -> str:
+        """Extract structured company information using the summary
+        
+        When ``on_token`` is given the completion is streamed and every
+        token is passed to it as soon as it arrives.
+        """
+        with self.diagnostics.stage('extract'):
+            return self._extract_company_info(company_data, base_url, on_token)
+    
+    def _extract_company_info(self, company_data: Dict, base_url: str,
+                              on_token: Optional[Callable[[str], None]] = None) -> str:
+        extraction_prompt = self.build_extraction_prompt(company_data, base_url)
+        
+        try:
+            with get_openai_callback() as callback:
+                if on_token is None:
+                    response = self.llm.predict(extraction_prompt)
+                else:
+                    tokens = []
+                    for chunk in self.llm.stream(extraction_prompt):
+                        tokens.append(chunk.content)
+                        on_token(chunk.content)
+                    response = ''.join(tokens)
+            self.record_usage(canonical_domain(base_url), 'extract', self.llm, extraction_prompt, response, callback)
+            
+            # Clean the response to ensure it's valid JSON
+            return self.clean_json_response(response)
+        except Exception as e:
+            logger.error("Error extracting company info: %s", e)
+            return "{}"
+    
+    def call_extraction_function(self, prompt: str, field_names: Optional[List[str]] = None,
+                                 on_token: Optional[Callable[[str], None]] = None,
+                                 llm: Optional[ChatOpenAI] = None,
+                                 company: str = '', stage: str = 'extract') -> Dict:
+        """Run one function-calling completion, meter it and decode its arguments"""
+        llm = llm or self.llm
+        messages = [HumanMessage(content=prompt)]
+        function_kwargs = {
+            'functions': [company_info_function(field_names)],
+            'function_call': {'name': FUNCTION_NAME}
+        }
+        
+        with get_openai_callback() as callback:
+            if on_token is None:
+                message = llm.predict_messages(messages, **function_kwargs)
+                arguments = message.additional_kwargs.get('function_call', {}).get('arguments', '')
+            else:
+                tokens = []
+                for chunk in llm.stream(messages, **function_kwargs):
+                    token = chunk.additional_kwargs.get('function_call', {}).get('arguments', '')
+                    if token:
+                        tokens.append(token)
+                        on_token(token)
+                arguments = ''.join(tokens)
+        self.record_usage(company, stage, llm, prompt + json.dumps(function_kwargs['functions']), arguments, callback)
+        
+        return load_arguments(arguments)
+    
+    def prepare_single_call_prompt(self, scraped_data: List[PageRecord], base_url: str,
+                                   max_chars: int = DEFAULT_PROMPT_CHARS) -> str:
+        """Pack the field-relevant chunks and scraped contact data into one prompt"""
+        # Selected within the budget, so pack_pages only clips the full-page fallback
+        relevant_content = self.retrieve_relevant_content(scraped_data, max_chars=max_chars)
+        return build_single_call_prompt(
+            pack_pages(relevant_content, max_chars), self.merge_structured_data(scraped_data), base_url
+        )
+    
+    def extract_company_info_single_call(self, scraped_data: List[PageRecord], base_url: str,
+                                         on_token: Optional[Callable[[str], None]] = None,
+                                         escalate: bool = True) -> CompanyInfo:
+        """Extract company information with one schema-constrained LLM call
+        
+        The field-relevant chunks are packed and sent once together with a
+        function spec generated from ``CompanyInfo``. Fields that come back
+        missing or malformed are repaired with a second call limited to them.
+        With ``escalate``, fields still missing or contradicting the scraped
+        contact data are re-queried with the next model in the cascade.
+        Contact values the deterministic extractors are sure of are pinned
+        and never asked for.
+        Repairs, escalation and prompt size are cut back as the token
+        budget of ``self.meter`` runs out.
+        """
+        with self.diagnostics.stage('extract'):
+            return self._extract_company_info_single_call(scraped_data, base_url, on_token, escalate)
+    
+    def _extract_company_info_single_call(self, scraped_data: List[PageRecord], base_url: str,
+                                          on_token: Optional[Callable[[str], None]] = None,
+                                          escalate: bool = True) -> CompanyInfo:
+        company = canonical_domain(base_url)
+        plan = self.meter.plan(company, len(scraped_data), escalate)
+        structured_data = self.merge_structured_data(scraped_data)
+        prompt = self.prepare_single_call_prompt(scraped_data, base_url, plan.max_prompt_chars)
+        
+        # High-confidence contact values are pinned and left out of the schema
+        pinned = pinned_values(structured_data)
+        field_names = unpinned_fields(pinned)
+        
+        try:
+            payload = self.call_extraction_function(prompt, field_names, on_token=on_token, company=company)
+            bad_fields = invalid_fields(payload, field_names)
+            if bad_fields and plan.allow_repairs and self.meter.allows(company):
+                repaired = self.call_extraction_function(
+                    build_repair_prompt(payload, bad_fields, prompt), field_names=bad_fields,
+                    company=company, stage='repair'
+                )
+                payload.update({name: repaired[name] for name in bad_fields if name in repaired})
+        except Exception as e:
+            logger.error("Error extracting company info: %s", e)
+            payload = {}
+        
+        info = apply_pinned(fill_from_deterministic(to_company_info(payload), structured_data), pinned)
+        
+        # Missing fields are only escalated when the site mentions them, with just those chunks
+        evidence = None
+        if plan.escalate and len(self.llms) > 1:
+            evidence = field_evidence(build_index(scraped_data, self.text_splitter), escalation_fields())
+        
+        for llm in (self.llms[1:] if plan.escalate else []):
+            unresolved = [name for name in unresolved_fields(info, structured_data, evidence) if name not in pinned]
+            if not unresolved or not self.meter.allows(company):
+                break
+            try:
+                escalated = self.call_extraction_function(
+                    build_escalation_prompt(info, unresolved, structured_data, evidence, base_url),
+                    field_names=unresolved, llm=llm, company=company, stage='escalate'
+                )
+            except Exception as e:
+                logger.warning("Escalation to %s failed: %s", llm.model_name, e)
+                break
+            info = merge_escalation(info, to_company_info(escalated), unresolved, structured_data)
+        
+        return info
+    
+    def with_meter(self, meter: TokenMeter) -> 'EnhancedWebScraper':
+        """Return a scraper sharing models, prober and diagnostics but metering into ``meter``"""
+        scraper = copy.copy(self)
+        scraper.meter = meter
+        return scraper
+    
+    def enrich(self, url: str, max_pages: int = 5, escalate: bool = True) -> CompanyInfo:
+        """Crawl a company site and extract its information in one go
+        
+        Concurrent calls for the same canonical domain (``example.com``,
+        ``www.example.com/``, ``https://example.com/about``) and the same
+        ``max_pages`` and ``escalate`` wait for the enrichment already in
+        flight instead of starting another one.
+        """
+        return _enrichments.do((canonical_domain(url), max_pages, escalate), self._enrich, url, max_pages, escalate)
+    
+    def _enrich(self, url: str, max_pages: int, escalate: bool) -> CompanyInfo:
+        plan = self.meter.plan(canonical_domain(url), max_pages, escalate)
+        scraped_data = self.crawl_company_site(url, plan.max_pages)
+        if not scraped_data:
+            return CompanyInfo()
+        return self.extract_company_info_single_call(scraped_data, url, escalate=plan.escalate)
@@ -0,0 +1,255 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+import requests
+
+from fetch import canonical_domain, canonical_url, fetch_capped
+
+CACHE_PATH = os.getenv("ENRICHMENT_PATH_CACHE", ".path_cache.json")
+
+# How long a remembered path availability is trusted
+CACHE_TTL = 30 * 24 * 3600
+
+NOT_FOUND_TITLE = re.compile(r'<title[^>]*>[^<]*(?:404|not found)[^<]*</title>', re.IGNORECASE)
+
+TAG_PATTERN = re.compile(r'<script.*?</script>|<style.*?</style>|<[^>]+>', re.IGNORECASE | re.DOTALL)
+
+@dataclass
+class ProbeResult:
+    url: str
+    available: bool
+    html: Optional[str] = None
+    final_url: str = ""
+    reason: str = ""
+    # Network errors, rate limits and server errors say nothing about whether the path exists
+    transient: bool = False
+    # The body hit the size cap: fine for soft-404 checks, not for scraping
+    truncated: bool = False
+    # Time spent fetching the page, for the scrape's diagnostics
+    fetch_seconds: float = 0.0
+
+@dataclass
+class SiteFingerprint:
+    """What the site serves for a path that cannot exist"""
+    status_code: int
+    final_url: str
+    shingles: FrozenSet[int]
+
+def shingles(html: str, size: int = 4) -> FrozenSet[int]:
+    """Hashed word n-grams of the visible text, for near-duplicate detection"""
+    words = TAG_PATTERN.sub(' ', html).lower().split()
+    return frozenset(hash(' '.join(words[i:i + size])) for i in range(max(1, len(words) - size + 1)))
+
+def is_subpath(url: str) -> bool:
+    """False for a site's root page"""
+    return bool(urlparse(url).path.strip('/'))
+
+def similarity(a: FrozenSet[int], b: FrozenSet[int]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class PathCache:
+    """Per-site paths known to be missing, remembered across runs in a JSON file
+    
+    Changes are kept in memory until ``save``, which callers invoke once
+    per run (and which also runs at exit for the shared cache). Saving
+    merges with what other processes wrote meanwhile and drops stale
+    entries, so the file stays bounded by the TTL.
+    """
+    
+    def __init__(self, path: str = CACHE_PATH, ttl: float = CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Dict]] = self._load()
+        # Entries this process found available again, with when that was seen
+        self._cleared: Dict[Tuple[str, str], float] = {}
+        self._dirty = False
+    
+    def _load(self) -> Dict[str, Dict[str, Dict]]:
+        try:
+            with open(self.path) as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+    
+    def get(self, site: str, url: str) -> Optional[bool]:
+        """Return the remembered availability of ``url``, or None if unknown or stale"""
+        with self._lock:
+            entry = self._entries.get(site, {}).get(canonical_url(url))
+        if entry is None or time.time() - entry['checked'] > self.ttl:
+            return None
+        return entry['available']
+    
+    def set(self, site: str, url: str, available: bool):
+        key, now = canonical_url(url), time.time()
+        with self._lock:
+            if available:
+                # Only misses are worth remembering; an available page is fetched anyway
+                if self._entries.get(site, {}).pop(key, None) is not None:
+                    self._cleared[site, key] = now
+                    self._dirty = True
+                return
+            self._entries.setdefault(site, {})[key] = {'available': False, 'checked': now}
+            self._dirty = True
+    
+    def save(self):
+        """Merge with the file on disk, drop stale entries and write it atomically"""
+        with self._lock:
+            if not self._dirty:
+                return
+            merged = self._load()
+            for site, entries in self._entries.items():
+                for key, entry in entries.items():
+                    current = merged.setdefault(site, {}).get(key)
+                    if current is None or current['checked'] < entry['checked']:
+                        merged[site][key] = entry
+            for (site, key), cleared in self._cleared.items():
+                if merged.get(site, {}).get(key, {}).get('checked', cleared) < cleared:
+                    del merged[site][key]
+            
+            cutoff = time.time() - self.ttl
+            merged = {
+                site: fresh for site, fresh in (
+                    (site, {key: entry for key, entry in entries.items() if entry['checked'] >= cutoff})
+                    for site, entries in merged.items()
+                ) if fresh
+            }
+            self._entries, self._cleared, self._dirty = merged, {}, False
+        
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as cache_file:
+            json.dump(merged, cache_file)
+        os.replace(tmp_path, self.path)
+
+_shared_cache: Optional[PathCache] = None
+_shared_lock = threading.Lock()
+
+def shared_cache() -> PathCache:
+    """The process-wide path cache, saved at exit"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = PathCache()
+            atexit.register(_shared_cache.save)
+        return _shared_cache
+
+class PathProber:
+    """Probes candidate pages of a site, skipping missing paths and soft-404s
+    
+    A site's "page not found" template is fingerprinted by requesting a
+    random path; a probed page that redirects to the same place or whose
+    text is nearly identical is treated as missing even when it returns 200.
+    """
+    
+    def __init__(self, cache: Optional[PathCache] = None, max_bytes: int = 262144,
+                 max_workers: int = 8, threshold: float = 0.85, hedge: Optional[bool] = None):
+        self.cache = cache if cache is not None else shared_cache()
+        self.max_bytes = max_bytes
+        self.hedge = hedge
+        self.max_workers = max_workers
+        self.threshold = threshold
+    
+    def fingerprint(self, base_url: str) -> Optional[SiteFingerprint]:
+        """Fetch a random path; None when the site answers it with a real error"""
+        try:
+            response, body = fetch_capped(
+                urljoin(base_url, f"/{uuid.uuid4().hex}"), max_bytes=self.max_bytes, hedge=self.hedge
+            )
+        except requests.RequestException:
+            return None
+        if response.status_code >= 400:
+            return None
+        return SiteFingerprint(
+            response.status_code, canonical_url(response.url), shingles(body.decode('utf-8', 'ignore'))
+        )
+    
+    def fetch(self, url: str) -> ProbeResult:
+        """Fetch a candidate page with a size cap, rejecting hard errors and 404 titles"""
+        started = time.perf_counter()
+        try:
+            response, body = fetch_capped(url, max_bytes=self.max_bytes, hedge=self.hedge)
+        except requests.RequestException as e:
+            return ProbeResult(url, False, reason=type(e).__name__, transient=True,
+                               fetch_seconds=time.perf_counter() - started)
+        elapsed = time.perf_counter() - started
+        
+        if response.status_code in (404, 410):
+            return ProbeResult(url, False, reason=f"http {response.status_code}", fetch_seconds=elapsed)
+        if response.status_code >= 400:
+            return ProbeResult(url, False, reason=f"http {response.status_code}", transient=True,
+                               fetch_seconds=elapsed)
+        
+        html = body.decode(response.encoding or 'utf-8', 'ignore')
+        # A home page may legitimately mention 404 in its title ("Studio 404")
+        if is_subpath(url) and NOT_FOUND_TITLE.search(html):
+            return ProbeResult(url, False, reason="soft 404 title", fetch_seconds=elapsed)
+        return ProbeResult(
+            url, True, html=html, final_url=canonical_url(response.url), truncated=len(body) >= self.max_bytes,
+            fetch_seconds=elapsed
+        )
+    
+    def classify(self, result: ProbeResult, fingerprint: Optional[SiteFingerprint]) -> ProbeResult:
+        """Mark an available page as missing when it looks like the site's soft 404"""
+        if not result.available or fingerprint is None or not is_subpath(result.url):
+            return result
+        if result.final_url == fingerprint.final_url and result.final_url != canonical_url(result.url):
+            return ProbeResult(result.url, False, reason="redirects like a missing page")
+        if similarity(shingles(result.html), fingerprint.shingles) >= self.threshold:
+            return ProbeResult(result.url, False, reason="matches soft 404 template")
+        return result
+    
+    def probe(self, base_url: str, urls: List[str]) -> List[ProbeResult]:
+        """
+        Probes candidate URLs of one site concurrently.
+        
+        Paths remembered as missing are skipped without a request; new
+        misses are remembered once the cache is saved.
+        
+        :param base_url: Site root, used for the soft-404 fingerprint.
+        :param urls: Candidate page URLs, in priority order.
+        :return: One result per distinct URL, in the same order; available ones carry their
+            HTML, cut off at ``max_bytes`` when ``truncated`` is set.
+        """
+        site = canonical_domain(base_url)
+        distinct, seen = [], set()
+        for url in urls:
+            if canonical_url(url) not in seen:
+                seen.add(canonical_url(url))
+                distinct.append(url)
+        
+        results: Dict[str, ProbeResult] = {}
+        to_check = []
+        for url in distinct:
+            if self.cache.get(site, url) is False:
+                results[url] = ProbeResult(url, False, reason="cached as missing")
+            else:
+                to_check.append(url)
+        
+        if to_check:
+            # Only sub-paths can be soft 404s, so the root alone needs no fingerprint
+            needs_fingerprint = any(is_subpath(url) for url in to_check)
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                fingerprint = executor.submit(self.fingerprint, base_url) if needs_fingerprint else None
+                fetched = list(executor.map(self.fetch, to_check))
+                site_fingerprint = fingerprint.result() if fingerprint else None
+            
+            for result in fetched:
+                result = self.classify(result, site_fingerprint)
+                results[result.url] = result
+                # The root is always probed; only definite answers about sub-paths are kept
+                if not result.transient and is_subpath(result.url):
+                    self.cache.set(site, result.url, result.available)
+        
+        return [results[url] for url in distinct]
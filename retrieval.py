@@ -0,0 +1,146 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from models import PageRecord
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Keyword queries describing where each target field usually appears on a site
+FIELD_QUERIES = {
+    'legal_name': "company name inc llc ltd corp corporation limited gmbh copyright founded",
+    'address': "address headquarters office located location street suite road avenue city zip",
+    'employees': "employees team people staff members workforce headcount",
+    'annual_revenue': "revenue annual sales million billion turnover growth",
+    'description': "about us we are mission provide services products solutions industry"
+}
+
+# Joins the chunks selected from one page
+CHUNK_SEPARATOR = " ... "
+
+# What a chunk must contain to count as evidence that a missing field is on the site
+EVIDENCE_PATTERNS = {
+    'legal_name': re.compile(r'\b(?:inc|llc|ltd|corp|corporation|limited|gmbh|plc)\b\.?|©|\(c\)', re.IGNORECASE),
+    'address': re.compile(r'\b\d{1,6}\s+\w+.{0,60}\b(?:street|st|avenue|ave|road|rd|suite|blvd)\b', re.IGNORECASE),
+    'employees': re.compile(r'\b\d[\d,]*\+?\s*(?:employees|people|staff|team members|professionals)\b', re.IGNORECASE),
+    'annual_revenue': re.compile(r'(?:[$€£]\s?\d[\d.,]*\s*(?:million|billion|[mb]n?)\b)|\brevenues? of\b', re.IGNORECASE),
+    'description': re.compile(r'\b(?:we are|we provide|we help|our mission|about us|we offer|we build)\b', re.IGNORECASE)
+}
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase and split text into alphanumeric terms"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """In-process Okapi BM25 index over text chunks"""
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.chunks: List[Tuple[str, str]] = []
+        self.term_freqs: List[Counter] = []
+        self.doc_freqs: Counter = Counter()
+        self.total_length = 0
+    
+    def add(self, url: str, text: str):
+        """Index a chunk of text taken from ``url``"""
+        terms = Counter(tokenize(text))
+        self.chunks.append((url, text))
+        self.term_freqs.append(terms)
+        self.doc_freqs.update(terms.keys())
+        self.total_length += sum(terms.values())
+    
+    def search(self, query: str, k: int = 3) -> List[Tuple[float, int]]:
+        """Return up to ``k`` (score, chunk id) pairs, best first"""
+        if not self.chunks:
+            return []
+        
+        doc_count = len(self.chunks)
+        avg_length = self.total_length / doc_count or 1
+        query_terms = set(tokenize(query))
+        
+        scores = []
+        for chunk_id, terms in enumerate(self.term_freqs):
+            length = sum(terms.values())
+            score = 0.0
+            for term in query_terms:
+                freq = terms.get(term)
+                if not freq:
+                    continue
+                idf = math.log(1 + (doc_count - self.doc_freqs[term] + 0.5) / (self.doc_freqs[term] + 0.5))
+                score += idf * freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * length / avg_length))
+            if score > 0:
+                scores.append((score, chunk_id))
+        
+        scores.sort(reverse=True)
+        return scores[:k]
+
+def build_index(scraped_data: List[PageRecord], text_splitter) -> BM25Index:
+    """Split every scraped page into chunks and index them"""
+    index = BM25Index()
+    for data in scraped_data:
+        for chunk in text_splitter.split_text(data.text):
+            index.add(data.url, chunk)
+    
+    return index
+
+def retrieve_field_chunks(index: BM25Index, k: int = 3, field_queries: Dict[str, str] = FIELD_QUERIES,
+                          max_chars: Optional[int] = None) -> List[PageRecord]:
+    """Retrieve the top-k chunks per target field, grouped back into pages
+    
+    Chunks are taken round-robin by rank (every field's best chunk, then
+    every field's second best, ...) and whole chunks that no longer fit in
+    ``max_chars`` are skipped, so the budget drops the weakest matches
+    rather than whatever happens to sit on a later page.
+    
+    :param index: Index built with :func:`build_index`.
+    :param k: Number of chunks to keep per field.
+    :param field_queries: Mapping of field name to keyword query.
+    :param max_chars: Total text budget, separators included; unlimited when None.
+    :return: One record per page holding only its selected chunks, in their
+             original order.
+    """
+    rankings = [[chunk_id for _, chunk_id in index.search(query, k)] for query in field_queries.values()]
+    ranked = []
+    for rank in range(k):
+        for ranking in rankings:
+            if rank < len(ranking) and ranking[rank] not in ranked:
+                ranked.append(ranking[rank])
+    
+    selected = set()
+    remaining = max_chars
+    for chunk_id in ranked:
+        size = len(index.chunks[chunk_id][1]) + len(CHUNK_SEPARATOR)
+        if remaining is not None and size > remaining:
+            continue
+        selected.add(chunk_id)
+        if remaining is not None:
+            remaining -= size
+    
+    page_chunks: Dict[str, List[str]] = {}
+    for chunk_id in sorted(selected):
+        url, text = index.chunks[chunk_id]
+        page_chunks.setdefault(url, []).append(text)
+    
+    return [PageRecord.from_text(url, CHUNK_SEPARATOR.join(chunks)) for url, chunks in page_chunks.items()]
+
+def field_evidence(index: BM25Index, field_names: List[str], k: int = 3) -> Dict[str, List[str]]:
+    """
+    Finds chunks that actually mention each field.
+    
+    :param index: Index built with :func:`build_index`.
+    :param field_names: Fields to look for; those without a query or pattern are skipped.
+    :param k: Number of top-ranked chunks inspected per field.
+    :return: Field name -> matching chunk texts, only for fields with evidence.
+    """
+    evidence = {}
+    for name in field_names:
+        if name not in FIELD_QUERIES or name not in EVIDENCE_PATTERNS:
+            continue
+        chunks = [index.chunks[chunk_id][1] for _, chunk_id in index.search(FIELD_QUERIES[name], k)]
+        matching = [chunk for chunk in chunks if EVIDENCE_PATTERNS[name].search(chunk)]
+        if matching:
+            evidence[name] = matching
+    
+    return evidence
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from diagnostics import Diagnostics
+from fetch import canonical_domain
+from metering import Budget, TokenMeter
+from pipeline import EnhancedWebScraper
+from triage import probe_domain
+
+logger = logging.getLogger(__name__)
+
+# Enrichments running at once across all jobs and requests
+MAX_CONCURRENCY = int(os.getenv("ENRICHMENT_SERVICE_CONCURRENCY", "8"))
+
+MAX_JOB_URLS = 1000
+
+# Finished jobs are forgotten after this many seconds
+JOB_TTL = 3600
+
+@dataclass
+class Job:
+    id: str
+    urls: List[str]
+    max_pages: int
+    escalate: bool
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    results: List[Dict] = field(default_factory=list)
+    
+    @property
+    def status(self) -> str:
+        if self.finished is not None:
+            return 'done'
+        return 'running' if self.results else 'queued'
+    
+    def summary(self) -> Dict:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total': len(self.urls),
+            'completed': len(self.results),
+            'results': self.results
+        }
+
+class EnrichmentService:
+    """Runs enrichment jobs in the background for the HTTP API
+    
+    All jobs share one scraper, so the path cache, per-host latency history
+    and in-flight coalescing are shared too, and one semaphore caps how many
+    companies are enriched at once however many requests arrive. Token usage
+    is metered per enrichment, so ``budget`` applies to each one afresh.
+    """
+    
+    def __init__(self, scraper: EnhancedWebScraper, concurrency: int = MAX_CONCURRENCY,
+                 budget: Optional[Budget] = None):
+        self.scraper = scraper
+        self.budget = budget or Budget()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.jobs: Dict[str, Job] = {}
+        self._changed: Dict[str, asyncio.Event] = {}
+        self._tasks = set()
+    
+    def submit(self, urls: List[str], max_pages: int = 5, escalate: bool = True) -> Job:
+        self.prune()
+        job = Job(uuid.uuid4().hex, urls, max_pages, escalate)
+        self.jobs[job.id] = job
+        self._changed[job.id] = asyncio.Event()
+        task = asyncio.create_task(self.run(job))
+        # Keep a reference so the task is not garbage collected mid-run
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+    
+    def prune(self):
+        now = time.time()
+        for job_id in [job.id for job in self.jobs.values() if job.finished and now - job.finished > JOB_TTL]:
+            del self.jobs[job_id]
+            del self._changed[job_id]
+    
+    async def run(self, job: Job):
+        await asyncio.gather(*(self.enrich_one(job, url) for url in job.urls))
+        job.finished = time.time()
+        self._notify(job)
+    
+    async def enrich_one(self, job: Job, url: str):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            try:
+                result = await loop.run_in_executor(self.executor, self.enrich_sync, url, job.max_pages, job.escalate)
+            except Exception as e:
+                logger.exception("Enrichment of %s failed", url)
+                result = {'url': url, 'status': 'failed', 'error': str(e)}
+        job.results.append(result)
+        self._notify(job)
+    
+    def enrich_sync(self, url: str, max_pages: int, escalate: bool) -> Dict:
+        """Triage and enrich one company; runs on a worker thread"""
+        triage = probe_domain(url)
+        if triage.status != 'live':
+            return {'url': url, 'status': triage.status, 'error': triage.reason}
+        meter = TokenMeter(self.budget)
+        info = self.scraper.with_meter(meter).enrich(triage.final_url, max_pages, escalate)
+        # An enrichment coalesced into one already in flight spent nothing itself
+        usage = meter.totals('company').get(canonical_domain(triage.final_url), {})
+        return {
+            'url': url,
+            'status': 'enriched',
+            'final_url': triage.final_url,
+            'info': asdict(info),
+            'tokens': usage.get('prompt_tokens', 0) + usage.get('completion_tokens', 0),
+            'cost': round(usage.get('cost', 0.0), 6)
+        }
+    
+    def _notify(self, job: Job):
+        # Wake current listeners, then arm a fresh event for the next change
+        self._changed[job.id].set()
+        self._changed[job.id] = asyncio.Event()
+    
+    async def events(self, job: Job) -> AsyncIterator[str]:
+        """Server-sent events: one ``result`` per company, then ``done``"""
+        sent = 0
+        while True:
+            changed = self._changed.get(job.id)
+            while sent < len(job.results):
+                yield f"event: result\ndata: {json.dumps(job.results[sent])}\n\n"
+                sent += 1
+            if job.finished is not None:
+                yield f"event: done\ndata: {json.dumps({'job_id': job.id, 'completed': sent})}\n\n"
+                return
+            await changed.wait()
+
+def parse_job_request(payload: Dict) -> Optional[str]:
+    """Return an error message if the body of a job request is invalid"""
+    urls = payload.get('urls', [payload['url']] if 'url' in payload else None)
+    if not isinstance(urls, list) or not urls or not all(isinstance(url, str) and url.strip() for url in urls):
+        return "provide 'url' or a non-empty list of 'urls'"
+    if len(urls) > MAX_JOB_URLS:
+        return f"at most {MAX_JOB_URLS} urls per job"
+    if not isinstance(payload.get('max_pages', 5), int) or not 1 <= payload.get('max_pages', 5) <= 20:
+        return "'max_pages' must be an integer between 1 and 20"
+    return None
+
+def create_app(scraper: Optional[EnhancedWebScraper] = None, concurrency: int = MAX_CONCURRENCY) -> Starlette:
+    """
+    Builds the enrichment API.
+    
+    ``POST /jobs`` takes ``{"url": ...}`` or ``{"urls": [...]}`` (plus
+    optional ``max_pages`` and ``escalate``) and returns a job id;
+    ``GET /jobs/{id}`` polls the job and ``GET /jobs/{id}/events`` streams
+    its results as server-sent events.
+    
+    :param scraper: Shared scraper; built from ``OPENAI_API_KEY`` with diagnostics off when omitted.
+        A scraper with diagnostics enabled has its report written on shutdown.
+    :param concurrency: Maximum enrichments running at once.
+    :return: The ASGI application.
+    """
+    state = {}
+    
+    @asynccontextmanager
+    async def lifespan(app: Starlette) -> AsyncIterator[None]:
+        shared = scraper
+        if shared is None:
+            load_dotenv()
+            # Diagnostics keep every page and profile for the process lifetime; the
+            # service never turns them on itself (profile a batch or app2 run instead)
+            shared = EnhancedWebScraper(os.getenv("OPENAI_API_KEY", ""), diagnostics=Diagnostics(enabled=False))
+        budget = os.getenv("ENRICHMENT_COMPANY_BUDGET")
+        state['service'] = EnrichmentService(
+            shared, concurrency, Budget(per_company_tokens=int(budget) if budget else None)
+        )
+        try:
+            yield
+        finally:
+            state['service'].executor.shutdown(wait=False, cancel_futures=True)
+            state['service'].scraper.prober.cache.save()
+            # A scraper passed in with diagnostics enabled gets its report on shutdown
+            diagnostics = state['service'].scraper.diagnostics
+            if diagnostics.enabled:
+                logger.info("Diagnostics report written to %s", diagnostics.write_report())
+            diagnostics.close()
+    
+    async def create_job(request: Request) -> JSONResponse:
+        try:
+            payload = await request.json()
+        except ValueError:
+            return JSONResponse({'error': "body must be JSON"}, status_code=400)
+        error = parse_job_request(payload) if isinstance(payload, dict) else "body must be a JSON object"
+        if error:
+            return JSONResponse({'error': error}, status_code=400)
+        
+        urls = [url.strip() for url in payload.get('urls', [payload.get('url')])]
+        job = state['service'].submit(urls, payload.get('max_pages', 5), bool(payload.get('escalate', True)))
+        return JSONResponse({
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': str(request.url_for('get_job', job_id=job.id)),
+            'events_url': str(request.url_for('job_events', job_id=job.id))
+        }, status_code=202)
+    
+    async def get_job(request: Request) -> JSONResponse:
+        job = state['service'].jobs.get(request.path_params['job_id'])
+        if job is None:
+            return JSONResponse({'error': "unknown job"}, status_code=404)
+        return JSONResponse(job.summary())
+    
+    async def job_events(request: Request):
+        job = state['service'].jobs.get(request.path_params['job_id'])
+        if job is None:
+            return JSONResponse({'error': "unknown job"}, status_code=404)
+        return StreamingResponse(
+            state['service'].events(job), media_type='text/event-stream', headers={'Cache-Control': 'no-cache'}
+        )
+    
+    async def health(request: Request) -> JSONResponse:
+        service = state['service']
+        return JSONResponse({
+            'status': 'ok',
+            'jobs': len(service.jobs),
+            'running': sum(1 for job in service.jobs.values() if job.finished is None)
+        })
+    
+    return Starlette(
+        routes=[
+            Route('/jobs', create_job, methods=['POST']),
+            Route('/jobs/{job_id}', get_job, methods=['GET'], name='get_job'),
+            Route('/jobs/{job_id}/events', job_events, methods=['GET'], name='job_events'),
+            Route('/health', health, methods=['GET'])
+        ],
+        lifespan=lifespan
+    )
+
+app = create_app()
+
+if __name__ == "__main__":
+    import uvicorn
+    
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=os.getenv("ENRICHMENT_SERVICE_HOST", "127.0.0.1"),
+                port=int(os.getenv("ENRICHMENT_SERVICE_PORT", "8000")))
@@ -0,0 +1,41 @@
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into a single execution
+    
+    The first caller for a key runs the function; callers arriving while it
+    is in flight wait for and receive the same result (or exception). Nothing
+    is cached once the call completes.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+    
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+    
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
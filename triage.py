@@ -0,0 +1,159 @@
+import re
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List
+from urllib.parse import urlparse
+
+import requests
+from bs4 import BeautifulSoup
+
+from fetch import HEADERS, fetch_capped, normalize_input, record_response, site_domain
+
+# Phrases that show up in the title or visible text of parked and for-sale templates
+# The listed domain may sit inside the for-sale phrase ("Acme.com is for sale",
+# "The domain acme.com may be for sale"); every variant counts as one signal
+PARKED_PHRASES = re.compile(
+    r'\b(?:(?:domain(?: name)?(?: [\w-]+(?:\.[\w-]+)+)?|[\w-]+(?:\.[\w-]+)+) (?:is|may be) for sale|'
+    r'buy this domain|get this domain|this domain is parked|parked free|domain parking|domain has expired|'
+    r'this domain name has been registered|courtesy of godaddy|related searches)\b',
+    re.IGNORECASE
+)
+
+# Parking and domain marketplace hosts, anchored so e.g. jordan.com does not match dan.com;
+# GoDaddy's parked pages load their lander from any of the wsimg.com image hosts
+PARKING_HOSTS = re.compile(
+    r'(?<![\w.-])(?:www\.|img\d*\.)?(parkingcrew\.net|sedoparking\.com|sedo\.com|bodis\.com|above\.com|'
+    r'dan\.com|afternic\.com|hugedomains\.com|undeveloped\.com|parklogic\.com|wsimg\.com/parking-lander)\b',
+    re.IGNORECASE
+)
+
+# Server placeholder pages, recognised by their whole title
+DEFAULT_PAGE_TITLES = re.compile(
+    r'^\s*(?:coming soon|index of /.*|welcome to nginx!?|default web site page|'
+    r'apache2 \w+ default page: it works)\s*$',
+    re.IGNORECASE
+)
+
+# Distinct parking signals needed before a page counts as parked
+PARKED_MIN_SIGNALS = 2
+
+@dataclass
+class TriageResult:
+    input_url: str
+    status: str  # 'live', 'alias', 'parked' or 'dead'
+    final_url: str = ""
+    domain: str = ""
+    reason: str = ""
+    alias_of: str = ""
+
+def resolves(host: str) -> bool:
+    try:
+        socket.getaddrinfo(host, None)
+        return True
+    except (socket.gaierror, UnicodeError):
+        return False
+
+def parked_signals(html: str) -> List[str]:
+    """
+    Lists the distinct parking signals on a page.
+    
+    Phrases are only looked for in the title and visible text; parking
+    hosts anywhere in the markup, since templates link or script them.
+    
+    :param html: The (possibly capped) page HTML.
+    :return: Matched phrases and hosts, lowercased and de-duplicated.
+    """
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.get_text(' ', strip=True) if soup.title else ''
+    if DEFAULT_PAGE_TITLES.match(title):
+        return ['default page: ' + title.lower()]
+    for element in soup(['script', 'style', 'noscript']):
+        element.extract()
+    visible = f"{title} {soup.get_text(' ', strip=True)}"
+    
+    signals = {'domain for sale' if match.lower().endswith('for sale') else match.lower()
+               for match in PARKED_PHRASES.findall(visible)}
+    signals |= {match.lower() for match in PARKING_HOSTS.findall(html)}
+    return sorted(signals)
+
+def is_parked(html: str) -> bool:
+    """A placeholder page, or at least ``PARKED_MIN_SIGNALS`` distinct parking signals"""
+    signals = parked_signals(html)
+    return any(signal.startswith('default page') for signal in signals) or len(signals) >= PARKED_MIN_SIGNALS
+
+def probe_domain(url: str, timeout: float = 5, max_bytes: int = 65536, check_parked: bool = True) -> TriageResult:
+    """
+    Classifies one input domain as live, parked or dead.
+    
+    Response times feed the fetch layer's latency history, so the crawl
+    that follows starts with per-host timeouts.
+    
+    :param url: Company URL or bare domain.
+    :param timeout: Per-request timeout in seconds.
+    :param max_bytes: Maximum body size read for the parked-page check.
+    :param check_parked: When False only a HEAD request is made.
+    :return: The triage result; ``final_url`` is set once redirects are resolved.
+    """
+    input_url = url.strip()
+    url = normalize_input(input_url)
+    host = urlparse(url).hostname or ''
+    if not host or not resolves(host):
+        return TriageResult(input_url, 'dead', reason='dns')
+    
+    # Bare domains are tried over https first, then plain http
+    candidates = [url] if url == input_url else [url, f"http://{input_url}"]
+    for candidate in candidates:
+        try:
+            if check_parked:
+                response, body = fetch_capped(candidate, timeout, max_bytes)
+            else:
+                response, body = requests.head(candidate, timeout=timeout, headers=HEADERS, allow_redirects=True), b''
+                record_response(candidate, response)
+                if response.status_code in (405, 501):
+                    response, body = fetch_capped(candidate, timeout, max_bytes)
+            break
+        except requests.RequestException as e:
+            error = e
+    else:
+        return TriageResult(input_url, 'dead', reason=type(error).__name__)
+    
+    final_url = response.url
+    result = TriageResult(input_url, 'live', final_url=final_url, domain=site_domain(final_url))
+    if response.status_code >= 400:
+        result.status, result.reason = 'dead', f"http {response.status_code}"
+    elif check_parked and is_parked(body.decode('utf-8', 'ignore')):
+        result.status, result.reason = 'parked', 'parked page template'
+    elif result.domain != site_domain(url):
+        result.reason = f"redirected to {result.domain}"
+    
+    return result
+
+def triage_domains(urls: List[str], max_workers: int = 32, timeout: float = 5,
+                   max_bytes: int = 65536) -> List[TriageResult]:
+    """
+    Probes all input domains concurrently and merges aliases.
+    
+    Inputs whose final URL lands on a domain already claimed by an earlier
+    input are marked ``alias`` so each site is crawled only once.
+    
+    :param urls: Company URLs or bare domains, in input order.
+    :return: One result per input, in the same order.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda url: probe_domain(url, timeout, max_bytes), urls))
+    
+    claimed = {}
+    for result in results:
+        if result.status != 'live':
+            continue
+        if result.domain in claimed:
+            result.status, result.alias_of = 'alias', claimed[result.domain]
+        else:
+            claimed[result.domain] = result.input_url
+    
+    return results
+
+def live_sites(results: List[TriageResult]) -> List[TriageResult]:
+    """Return the results that should be crawled"""
+    return [result for result in results if result.status == 'live']